@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Benchmark cold image downloads under simulated network conditions.
+
+Usage:
+    python3 Scripts/bench_fetch.py [options]   (see --help)
+
+Serves the committed image cache from a local SimServer (netsim_server.py)
+under each network profile, then runs the generator's prefetch_images()
+against an empty cache, exactly as a cold build would: keep-alive
+connections, per-host limits, retries with backoff and the time budget
+all take part. No internet access is needed.
+
+Results are printed, or written with --json, as machine-readable JSON.
+With --check the run exits non-zero if any image failed to download or a
+run exceeded --max-seconds, so the numbers can guard against regressions.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import tempfile
+import time
+
+import generate_postural_plan as gen
+from bench_postural_plan import _git_commit
+from netsim_server import PROFILES, SimServer, local_url, routes_from_cache
+
+
+def cold_fetch(urls: list, cache_dir: str, args) -> dict:
+    """Download urls into an empty cache at cache_dir; return timings and counters."""
+    gen.CACHE_DIR = cache_dir
+    gen._image_cache = None
+    gen._http_pool = gen.HostPool()
+    gen._failed_downloads.clear()
+    gen._retry_policy = gen.RetryPolicy(retries=args.retries, backoff=args.backoff,
+                                        timeout=args.timeout)
+    gen._stats = gen.Stats()
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        gen.prefetch_images(urls, workers=args.workers, per_host=args.per_host,
+                            budget=args.budget)
+    wall = time.perf_counter() - start
+
+    cache = gen.image_cache()
+    counters = gen._stats.report()["cache"]
+    gen._stats = None
+    return {
+        "wall_s": wall,
+        "fetched": sum(1 for url in urls if cache.lookup(url)),
+        "failed": len(gen._failed_downloads),
+        "retries": counters["retries"],
+        "bytes": sum(cache.entries[url]["size"] for url in urls if url in cache.entries),
+    }
+
+
+def bench(profile_name: str, urls: list, routes: dict, args) -> dict:
+    """Best wall time over args.repeat cold runs of one profile; counters from the slowest."""
+    runs, served = [], []
+    for run in range(args.repeat):
+        with SimServer(routes, seed=args.seed + run, **PROFILES[profile_name]).start() as server:
+            local = [local_url(url, server.base_url) for url in urls]
+            with tempfile.TemporaryDirectory() as cache_dir:
+                runs.append(cold_fetch(local, cache_dir, args))
+            served.append(dict(server.counters))
+    best = min(runs, key=lambda r: r["wall_s"])
+    worst = max(runs, key=lambda r: r["wall_s"])
+    return {
+        "profile": profile_name,
+        "conditions": PROFILES[profile_name],
+        "wall_s": best["wall_s"],
+        "worst_wall_s": worst["wall_s"],
+        "fetched": min(r["fetched"] for r in runs),
+        "failed": max(r["failed"] for r in runs),
+        "retries": max(r["retries"] for r in runs),
+        "bytes": best["bytes"],
+        "server": served[runs.index(worst)],
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark image downloads offline")
+    parser.add_argument(
+        "--profiles", default=",".join(PROFILES),
+        help=f"comma-separated network profiles (default: {','.join(PROFILES)})",
+    )
+    parser.add_argument(
+        "--copies", type=int, default=1,
+        help="serve every cached image under this many URLs, to scale the workload (default: 1)",
+    )
+    parser.add_argument("--workers", type=int, default=8, help="download threads (default: 8)")
+    parser.add_argument("--per-host", type=int, default=4,
+                        help="connections per host (default: 4)")
+    parser.add_argument("--retries", type=int, default=3, help="retries per image (default: 3)")
+    parser.add_argument("--backoff", type=float, default=0.5,
+                        help="first retry delay in seconds, doubled each retry (default: 0.5)")
+    parser.add_argument("--timeout", type=float, default=15,
+                        help="seconds per attempt (default: 15)")
+    parser.add_argument("--budget", type=float, help="total seconds allowed per cold fetch")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per profile (default: 3)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check", action="store_true",
+                        help="exit with status 1 if any image failed or a run was too slow")
+    parser.add_argument("--max-seconds", type=float,
+                        help="with --check, the slowest acceptable run of any profile")
+    parser.add_argument("--json", help="write results to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    routes = routes_from_cache()
+    if not routes:
+        sys.exit(f"ERROR: {gen.CACHE_DIR} has no cached images to serve")
+    base_urls = list(gen.ImageCache(gen.CACHE_DIR).entries)
+    urls = [url if copy == 0 else f"{url}?copy={copy}"
+            for copy in range(args.copies) for url in base_urls]
+
+    results = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "images": len(urls),
+        "results": [],
+    }
+    problems = []
+    for name in args.profiles.split(","):
+        if name not in PROFILES:
+            sys.exit(f"ERROR: unknown profile {name!r} (choose from {', '.join(PROFILES)})")
+        result = bench(name, urls, routes, args)
+        results["results"].append(result)
+        print(f"  {name:<10} {result['wall_s'] * 1000:>9.1f} ms "
+              f"(worst {result['worst_wall_s'] * 1000:.1f} ms)  "
+              f"{result['fetched']}/{len(urls)} fetched, {result['retries']} retries",
+              file=sys.stderr)
+        if result["failed"]:
+            problems.append(f"{name}: {result['failed']} image(s) failed")
+        if args.max_seconds and result["worst_wall_s"] > args.max_seconds:
+            problems.append(f"{name}: {result['worst_wall_s']:.2f} s exceeds {args.max_seconds} s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.check and problems:
+        for problem in problems:
+            print(f"FAIL: {problem}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
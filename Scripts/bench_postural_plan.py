@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Benchmark how generate_postural_plan.py scales with plan size.
+
+Usage:
+    python3 Scripts/bench_postural_plan.py [options]   (see --help)
+
+Builds synthetic plans with the generator's own build_routines(), using
+fixture images written to a temporary directory (no network). Each phase
+runs in a fresh process so its peak RSS is its own:
+
+    build        build_routines() of the plan (image loading and hashing included)
+    ingest       ingest_local_images() of every fixture with an empty index
+    ingest:warm  the same with the index from an earlier run, as on a rebuild
+    clean_nulls  clean_nulls() over the built data
+    dump:NAME    dumps_json() of the cleaned data with each installed
+                 backend (stdlib, orjson), images inlined
+    stream       write_json() of the built data
+
+Results are printed, or written with --json, as machine-readable JSON so
+runs from different commits can be compared. Every writer must produce the
+same bytes; with --check the run exits non-zero if any of them differs.
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import generate_postural_plan as gen
+
+BACKENDS = [name for name in gen.JSON_BACKENDS
+            if name == "stdlib" or importlib.util.find_spec(name)]
+PHASES = ("build", "ingest", "ingest:warm", "clean_nulls",
+          *(f"dump:{name}" for name in BACKENDS), "stream")
+# Fixtures are dated in the past, so the local index trusts their mtimes
+FIXTURE_MTIME = 1_600_000_000
+
+
+def _int_list(text: str) -> list:
+    return [int(part) for part in text.split(",")]
+
+
+def _peak_rss_kb() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def plan_layout(spec: dict) -> list:
+    """Return, for every exercise of every routine, the fixture files it shows.
+
+    The first references use distinct images; with reuse > 0 that fraction
+    of references then points back at images already used.
+    """
+    rng = random.Random(spec["seed"])
+    total = spec["routines"] * spec["exercises"] * spec["images_per_exercise"]
+    distinct = max(1, round(total * (1 - spec["reuse"]))) if total else 0
+    names = [f"img{i:06d}.jpg" for i in range(distinct)]
+    refs = names + [rng.choice(names) for _ in range(total - distinct)] if total else []
+
+    layout, pos = [], 0
+    for _ in range(spec["routines"]):
+        routine = []
+        for _ in range(spec["exercises"]):
+            routine.append(refs[pos:pos + spec["images_per_exercise"]])
+            pos += spec["images_per_exercise"]
+        layout.append(routine)
+    return layout
+
+
+def fixture_names(spec: dict) -> list:
+    return sorted({name for routine in plan_layout(spec) for ex in routine for name in ex})
+
+
+def write_fixtures(spec: dict, directory: str):
+    """Write one pseudo-random JPEG-looking file per distinct image."""
+    rng = random.Random(spec["seed"])
+    for name in fixture_names(spec):
+        path = os.path.join(directory, name)
+        with open(path, "wb") as f:
+            f.write(b"\xff\xd8\xff\xe0" + rng.randbytes(spec["image_kb"] * 1024 - 4))
+        os.utime(path, (FIXTURE_MTIME, FIXTURE_MTIME))
+
+
+def synthetic_plan(spec: dict) -> dict:
+    """A plan for gen.build_routines() with the shape spec describes."""
+    routines = []
+    for r, layout in enumerate(plan_layout(spec)):
+        exercises = []
+        for e, files in enumerate(layout):
+            exercises.append({
+                "name": f"Exercise {r}.{e}",
+                "duration_seconds": 30 if e % 2 else 0,
+                "description": "Synthetic benchmark exercise. " * 4,
+                "sets": 3, "rest_seconds": 15, "rest_after_seconds": 30,
+                "reps": 0 if e % 2 else 10, "seconds_per_rep": 5,
+                "images": files,
+            })
+        routines.append({"name": f"Routine {r}", "exercises": exercises})
+    return {"routines": routines}
+
+
+def run_phase(spec: dict, fixture_dir: str, out_dir: str, phase: str, layout: str) -> dict:
+    """Run the prerequisites of phase, then time it. Runs in a fresh process."""
+    gen.LOCAL_IMG_DIR = fixture_dir
+    layout = gen.JSON_LAYOUTS[layout]
+    result = {}
+
+    if phase == "build":
+        rss_before = _peak_rss_kb()
+        plan = synthetic_plan(spec)
+        start = time.perf_counter()
+        gen.build_routines(plan)
+    elif phase.startswith("ingest"):
+        gen.CACHE_DIR = os.path.join(out_dir, "cache")
+        shutil.rmtree(gen.CACHE_DIR, ignore_errors=True)
+        names = fixture_names(spec)
+        if phase == "ingest:warm":
+            gen.ingest_local_images(names)
+            gen._images_by_source.clear()
+            gen._images_by_digest.clear()
+        rss_before = _peak_rss_kb()
+        start = time.perf_counter()
+        gen.ingest_local_images(names)
+    else:
+        data = gen.build_routines(synthetic_plan(spec))
+        if phase.startswith("dump:"):
+            data = gen.clean_nulls(data)
+        rss_before = _peak_rss_kb()
+        start = time.perf_counter()
+        if phase == "clean_nulls":
+            gen.clean_nulls(data)
+        else:
+            path = os.path.join(out_dir, f"{phase.replace(':', '-')}.json")
+            if phase == "stream":
+                with open(path, "w", encoding="utf-8") as f:
+                    gen.write_json(data, f, layout=layout)
+            else:
+                encoded = gen.dumps_json(data, layout, phase.split(":")[1])
+                with open(path, "wb") as f:
+                    f.write(encoded)
+
+    result["wall_s"] = time.perf_counter() - start
+    result["peak_rss_kb"] = _peak_rss_kb()
+    result["rss_growth_kb"] = result["peak_rss_kb"] - rss_before
+    if phase.startswith(("dump:", "stream")):
+        result["output_bytes"] = os.path.getsize(path)
+        with open(path, "rb") as f:
+            result["sha256"] = hashlib.sha256(f.read()).hexdigest()
+    return result
+
+
+def bench(spec: dict, repeat: int, layout: str) -> dict:
+    """Benchmark every phase for one spec; best wall time and worst RSS win."""
+    ctx = multiprocessing.get_context("spawn")
+    phases = {}
+    with tempfile.TemporaryDirectory() as fixture_dir, tempfile.TemporaryDirectory() as out_dir:
+        write_fixtures(spec, fixture_dir)
+        for phase in PHASES:
+            runs = []
+            for _ in range(repeat):
+                with concurrent.futures.ProcessPoolExecutor(1, mp_context=ctx) as pool:
+                    runs.append(pool.submit(run_phase, spec, fixture_dir, out_dir, phase,
+                                             layout).result())
+            best = min(runs, key=lambda r: r["wall_s"])
+            best["peak_rss_kb"] = max(r["peak_rss_kb"] for r in runs)
+            best["rss_growth_kb"] = max(r["rss_growth_kb"] for r in runs)
+            phases[phase] = best
+    return {"spec": spec, "phases": phases}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the postural plan generator")
+    parser.add_argument(
+        "--routines", type=_int_list, default=[7, 50, 100],
+        help="comma-separated routine counts to sweep (default: 7,50,100)",
+    )
+    parser.add_argument("--exercises", type=int, default=6, help="exercises per routine (default: 6)")
+    parser.add_argument(
+        "--images-per-exercise", type=int, default=1, help="images per exercise (default: 1)",
+    )
+    parser.add_argument("--image-kb", type=int, default=48, help="size of each image (default: 48)")
+    parser.add_argument(
+        "--reuse", type=float, default=0.4,
+        help="fraction of image references that reuse an earlier image (default: 0.4)",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="runs per phase (default: 3)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json-layout", choices=tuple(gen.JSON_LAYOUTS), default="python",
+                        help="output layout every writer produces (default: python)")
+    parser.add_argument("--check", action="store_true",
+                        help="exit with status 1 if the writers' outputs are not byte-identical")
+    parser.add_argument("--json", help="write results to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "layout": args.json_layout,
+        "results": [],
+    }
+    problems = []
+
+    for routines in args.routines:
+        spec = {
+            "routines": routines,
+            "exercises": args.exercises,
+            "images_per_exercise": args.images_per_exercise,
+            "image_kb": args.image_kb,
+            "reuse": args.reuse,
+            "seed": args.seed,
+        }
+        result = bench(spec, args.repeat, args.json_layout)
+        results["results"].append(result)
+        print(f"routines={routines}", file=sys.stderr)
+        for phase, stats in result["phases"].items():
+            size = f" {stats['output_bytes'] / 1024 / 1024:.1f} MB" if "output_bytes" in stats else ""
+            print(f"  {phase:<12} {stats['wall_s'] * 1000:>9.1f} ms "
+                  f"{stats['peak_rss_kb'] / 1024:>7.1f} MB peak RSS{size}", file=sys.stderr)
+        digests = {phase: stats["sha256"] for phase, stats in result["phases"].items()
+                   if "sha256" in stats}
+        if len(set(digests.values())) > 1:
+            problems.append(f"routines={routines}: outputs differ "
+                            f"({', '.join(f'{p} {d[:12]}' for p, d in digests.items())})")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.check and problems:
+        for problem in problems:
+            print(f"FAIL: {problem}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Convert routine files between inline-Base64 JSON and zip bundles.
+
+Usage:
+    python3 Scripts/convert_routines.py to-bundle routines.json routines.zip
+    python3 Scripts/convert_routines.py to-json routines.zip routines.json [--json-layout app]
+    python3 Scripts/convert_routines.py compare routines.json
+
+A bundle holds a routines.json manifest with the same shape as the JSON
+file, except that exercise "images" name members of the zip; the images
+themselves are stored raw and uncompressed (see write_bundle). Files
+written with --images table hold their images in an "imageTable" and are
+not supported; generate them with the default inline images instead.
+
+compare writes the file in both formats to a temporary directory and
+reports size, encode time and decode time for each.
+"""
+
+import argparse
+import base64
+import hashlib
+import io
+import json
+import mmap
+import os
+import sys
+import tempfile
+import time
+
+from generate_postural_plan import (
+    JSON_LAYOUTS,
+    ImageRef,
+    bundle_member_span,
+    exercise_images,
+    map_images,
+    read_bundle,
+    write_bundle,
+    write_json,
+)
+
+
+class InlineImage(ImageRef):
+    """An image held in memory, as decoded from an inline-Base64 JSON file."""
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data: bytes, b64: str = None):
+        self._data = data
+        self.path = None
+        self.size = len(data)
+        self.digest = hashlib.sha256(data).hexdigest()
+        self._b64 = b64
+
+    def open(self):
+        return io.BytesIO(self._data)
+
+    @property
+    def data(self) -> bytes:
+        return self._data
+
+
+def _read_inline(path: str) -> dict:
+    """Read a routine file, refusing ones whose images are not inline Base64."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if "imageTable" in data or any(
+        "imageRefs" in ex for routine in data.get("routines", []) for ex in routine["exercises"]
+    ):
+        raise ValueError(f"{path}: images are in an imageTable (--images table); "
+                         "only files with inline images can be converted")
+    return data
+
+
+def load_json(path: str):
+    """Read an inline-Base64 routine file, decoding every image."""
+    data = _read_inline(path)
+    return map_images(data, lambda b64: InlineImage(base64.b64decode(b64), b64))
+
+
+def json_to_bundle(src: str, dst: str, layout: str = "python"):
+    write_bundle(load_json(src), dst, JSON_LAYOUTS[layout])
+
+
+def bundle_to_json(src: str, dst: str, layout: str = "python"):
+    data, zf = read_bundle(src)
+    with zf, open(dst, "w", encoding="utf-8") as f:
+        write_json(data, f, layout=JSON_LAYOUTS[layout])
+
+
+def _decode_bundle(path: str) -> int:
+    """Open a bundle and slice every image out of a memory map without copying."""
+    data, zf = read_bundle(path)
+    total = 0
+    with zf, open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        for routine in data["routines"]:
+            for ex in routine["exercises"]:
+                for image in exercise_images(ex):
+                    offset, size = bundle_member_span(zf, image.member)
+                    total += len(view[offset:offset + size])
+        view.release()
+    return total
+
+
+def compare(src: str):
+    data = map_images(_read_inline(src), lambda b64: InlineImage(base64.b64decode(b64)))
+    rows = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "routines.json")
+        start = time.perf_counter()
+        with open(json_path, "w", encoding="utf-8") as f:
+            write_json(data, f)
+        encode = time.perf_counter() - start
+        start = time.perf_counter()
+        load_json(json_path)
+        decode = time.perf_counter() - start
+        rows.append(("json", os.path.getsize(json_path), encode, decode))
+
+        bundle_path = os.path.join(tmp, "routines.zip")
+        start = time.perf_counter()
+        write_bundle(data, bundle_path)
+        encode = time.perf_counter() - start
+        start = time.perf_counter()
+        _decode_bundle(bundle_path)
+        decode = time.perf_counter() - start
+        rows.append(("bundle", os.path.getsize(bundle_path), encode, decode))
+
+    print(f"{'Format':<8} {'Size':>12} {'Encode':>10} {'Decode':>10}")
+    for name, size, encode, decode in rows:
+        print(f"{name:<8} {size / 1024:>9.1f} KB {encode * 1000:>7.1f} ms {decode * 1000:>7.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert routine files between JSON and bundles")
+    sub = parser.add_subparsers(dest="command", required=True)
+    to_bundle = sub.add_parser("to-bundle", help="inline-Base64 JSON to zip bundle")
+    to_json = sub.add_parser("to-json", help="zip bundle to inline-Base64 JSON")
+    for command in (to_bundle, to_json):
+        command.add_argument("src")
+        command.add_argument("dst")
+        command.add_argument(
+            "--json-layout", choices=tuple(JSON_LAYOUTS), default="python",
+            help="layout of the JSON written (see generate_postural_plan.py --json-layout)",
+        )
+    cmp_parser = sub.add_parser("compare", help="report size and speed of both formats")
+    cmp_parser.add_argument("src", help="inline-Base64 JSON file")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "to-bundle":
+            json_to_bundle(args.src, args.dst, args.json_layout)
+        elif args.command == "to-json":
+            bundle_to_json(args.src, args.dst, args.json_layout)
+        else:
+            compare(args.src)
+            return
+    except ValueError as e:
+        sys.exit(f"ERROR: {e}")
+    print(f"Wrote {args.dst} ({os.path.getsize(args.dst) / 1024:.1f} KB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Compare two routine exports and build or apply compact delta files.
+
+Usage:
+    python3 Scripts/diff_routines.py diff base.json new.json [-o delta.json]
+    python3 Scripts/diff_routines.py apply base.json delta.json -o new.json
+
+Routines, exercises and images are compared by hash (images by the SHA-256
+of their decoded bytes). A delta lists, in the new file's order, which base
+routines and exercises are kept, which are modified (only the changed
+fields) and which are added. It carries only the images the base does not
+already have, so a description tweak costs bytes, not megabytes.
+
+A delta records hashes of the base it was made from and of the result;
+apply refuses a different base and checks the result.
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import sys
+
+DELTA_FORMAT = "pulse-routine-delta"
+DELTA_VERSION = 1
+
+
+def _hash(obj) -> str:
+    canonical = json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def load_routines(path: str):
+    """Read a RoutineFile with images replaced by digests.
+
+    Returns (routines, images) where images maps digest -> Base64 string.
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    images = {}
+    for routine in data["routines"]:
+        for ex in routine["exercises"]:
+            if "images" in ex:
+                digests = []
+                for b64 in ex["images"]:
+                    digest = hashlib.sha256(base64.b64decode(b64)).hexdigest()
+                    images.setdefault(digest, b64)
+                    digests.append(digest)
+                ex["images"] = digests
+    return data["routines"], images
+
+
+def _diff_fields(old: dict, new: dict, skip=()) -> dict:
+    op = {}
+    fields = {k: v for k, v in new.items() if k not in skip and (k not in old or old[k] != v)}
+    removed = [k for k in old if k not in skip and k not in new]
+    if fields:
+        op["fields"] = fields
+    if removed:
+        op["removed"] = removed
+    return op
+
+
+def _match(base_items: list, new_items: list, key):
+    """Pair each new item with an unused base item: same hash first, then same key.
+
+    Yields (base_index or None, exact) for every new item, in order.
+    """
+    hashes = [_hash(item) for item in base_items]
+    used = set()
+    pairs = []
+    for item in new_items:
+        h = _hash(item)
+        index = next((i for i, bh in enumerate(hashes) if bh == h and i not in used), None)
+        exact = index is not None
+        if index is None:
+            index = next((i for i, b in enumerate(base_items)
+                          if key(b) == key(item) and i not in used), None)
+        if index is not None:
+            used.add(index)
+        pairs.append((index, exact))
+    return pairs, used
+
+
+def make_delta(base_path: str, new_path: str) -> dict:
+    base, base_images = load_routines(base_path)
+    new, new_images = load_routines(new_path)
+
+    ops = []
+    stats = {"added": [], "removed": [], "modified": [], "kept": 0,
+             "exercisesAdded": 0, "exercisesRemoved": 0, "exercisesModified": 0}
+    pairs, used = _match(base, new, lambda r: r.get("name"))
+    for routine, (index, exact) in zip(new, pairs):
+        if exact:
+            ops.append({"keep": index})
+            stats["kept"] += 1
+            continue
+        if index is None:
+            ops.append({"add": routine})
+            stats["added"].append(routine.get("name"))
+            stats["exercisesAdded"] += len(routine["exercises"])
+            continue
+
+        old = base[index]
+        op = {"modify": index, **_diff_fields(old, routine, skip=("exercises",))}
+        ex_ops = []
+        ex_pairs, ex_used = _match(old["exercises"], routine["exercises"], lambda e: e.get("name"))
+        for ex, (j, ex_exact) in zip(routine["exercises"], ex_pairs):
+            if ex_exact:
+                ex_ops.append({"keep": j})
+            elif j is None:
+                ex_ops.append({"add": ex})
+                stats["exercisesAdded"] += 1
+            else:
+                ex_ops.append({"modify": j, **_diff_fields(old["exercises"][j], ex)})
+                stats["exercisesModified"] += 1
+        stats["exercisesRemoved"] += len(old["exercises"]) - len(ex_used)
+        op["exercises"] = ex_ops
+        ops.append(op)
+        stats["modified"].append(routine.get("name"))
+    stats["removed"] = [r.get("name") for i, r in enumerate(base) if i not in used]
+
+    return {
+        "format": DELTA_FORMAT,
+        "version": DELTA_VERSION,
+        "base": _hash(base),
+        "result": _hash(new),
+        "summary": stats,
+        "routines": ops,
+        "images": {d: b64 for d, b64 in new_images.items() if d not in base_images},
+    }
+
+
+def _patch(old: dict, op: dict) -> dict:
+    result = {k: v for k, v in old.items() if k not in op.get("removed", ())}
+    result.update(op.get("fields", {}))
+    return result
+
+
+def apply_delta(base_path: str, delta: dict, force: bool = False) -> dict:
+    """Apply delta to the file at base_path and return the new RoutineFile data."""
+    if delta.get("format") != DELTA_FORMAT or delta.get("version") != DELTA_VERSION:
+        raise ValueError("Not a supported routine delta")
+    base, base_images = load_routines(base_path)
+    if _hash(base) != delta["base"] and not force:
+        raise ValueError("Delta was made from a different base file")
+
+    routines = []
+    for op in delta["routines"]:
+        if "keep" in op:
+            routines.append(base[op["keep"]])
+        elif "add" in op:
+            routines.append(op["add"])
+        else:
+            old = base[op["modify"]]
+            routine = _patch(old, op)
+            exercises = []
+            for ex_op in op["exercises"]:
+                if "keep" in ex_op:
+                    exercises.append(old["exercises"][ex_op["keep"]])
+                elif "add" in ex_op:
+                    exercises.append(ex_op["add"])
+                else:
+                    exercises.append(_patch(old["exercises"][ex_op["modify"]], ex_op))
+            routine["exercises"] = exercises
+            routines.append(routine)
+
+    if _hash(routines) != delta["result"] and not force:
+        raise ValueError("Applying the delta did not reproduce the expected result")
+
+    images = {**base_images, **delta["images"]}
+    for routine in routines:
+        for ex in routine["exercises"]:
+            if "images" in ex:
+                ex["images"] = [images[digest] for digest in ex["images"]]
+    return {"routines": routines}
+
+
+def _write(obj, path: str):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=2, ensure_ascii=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Diff routine exports and apply deltas")
+    sub = parser.add_subparsers(dest="command", required=True)
+    diff_parser = sub.add_parser("diff", help="describe changes and optionally write a delta")
+    diff_parser.add_argument("base")
+    diff_parser.add_argument("new")
+    diff_parser.add_argument("-o", "--output", help="write the delta to this file")
+    apply_parser = sub.add_parser("apply", help="apply a delta to its base file")
+    apply_parser.add_argument("base")
+    apply_parser.add_argument("delta")
+    apply_parser.add_argument("-o", "--output", required=True)
+    apply_parser.add_argument("--force", action="store_true",
+                              help="apply even if the base or result hash does not match")
+    args = parser.parse_args(argv)
+
+    if args.command == "apply":
+        with open(args.delta, encoding="utf-8") as f:
+            delta = json.load(f)
+        try:
+            data = apply_delta(args.base, delta, force=args.force)
+        except ValueError as e:
+            sys.exit(f"ERROR: {e}")
+        _write(data, args.output)
+        print(f"Wrote {args.output} ({len(data['routines'])} routine(s))")
+        return
+
+    delta = make_delta(args.base, args.new)
+    s = delta["summary"]
+    print(f"Routines: {s['kept']} unchanged, {len(s['modified'])} modified, "
+          f"{len(s['added'])} added, {len(s['removed'])} removed")
+    for label in ("modified", "added", "removed"):
+        for name in s[label]:
+            print(f"  {label}: {name}")
+    print(f"Exercises: {s['exercisesModified']} modified, {s['exercisesAdded']} added, "
+          f"{s['exercisesRemoved']} removed")
+    image_bytes = sum(len(b64) for b64 in delta["images"].values())
+    print(f"New images: {len(delta['images'])} ({image_bytes / 1024:.1f} KB as Base64)")
+    if args.output:
+        _write(delta, args.output)
+        print(f"Wrote {args.output}: {os.path.getsize(args.output) / 1024:.1f} KB "
+              f"(full file: {os.path.getsize(args.new) / 1024:.1f} KB)")
+
+
+if __name__ == "__main__":
+    main()
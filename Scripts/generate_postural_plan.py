@@ -3,62 +3,1304 @@
 Generate postural_routines.json with embedded Base64 images.
 
 Usage:
-    python3 Scripts/generate_postural_plan.py
+    python3 Scripts/generate_postural_plan.py [options]   (see --help)
+    python3 Scripts/generate_postural_plan.py --plan Scripts/plans/*.json --jobs 4
+
+Input:
+    Scripts/plans/postural.json, or any plan files given with --plan
+    (JSON, TOML or YAML; see load_plan).
 
 Output:
-    Scripts/postural_routines.json
+    Scripts/postural_routines.json, or per plan the file named by its
+    "output" field (default: the plan's name with .json), in --out-dir.
+
+Several plans are compiled in one run: their images are fetched, hashed
+and normalized once, then the plans are written in parallel worker
+processes that share those images.
+
+Image modes:
+    inline  Every exercise carries its own Base64 copies in "images"
+            (the format the app imports).
+    table   Each distinct image is encoded once into a top-level
+            "imageTable" keyed by SHA-256; exercises list the keys they
+            use in "imageRefs".
+
+Image variants:
+    --variant NAME=SIZE (repeatable) adds an "imageVariants" field next to
+    "images" with each image downscaled to SIZE px, e.g. thumb=160 for
+    list views. "images" keeps the full-size copies older app builds read.
+
+Similar images:
+    --similar reports clusters of near-duplicate images (perceptual hash,
+    cached in .img_cache/phash.json); --collapse-similar embeds only the
+    largest image of each cluster.
+
+JSON layouts:
+    --json-layout app lays the file out as the app's export does (sorted
+    keys, " : " after keys, "/" escaped), so generated and exported files
+    diff cleanly. Every writer and --json-backend writes identical bytes.
 """
 
+import argparse
 import base64
+import concurrent.futures
+import datetime
+import functools
+import gzip
+import hashlib
+import http.client
+import importlib.util
+import inspect
+import io
 import json
+import mmap
 import os
+import random
+import select
+import shutil
+import stat
+import struct
 import sys
+import threading
+import time
+import urllib.parse
 import urllib.request
+import zipfile
 
 LOCAL_IMG_DIR = os.path.expanduser("~/Documents/post/img")
-OUTPUT_PATH = os.path.join(os.path.dirname(__file__), "postural_routines.json")
+OUTPUT_DIR = os.path.dirname(__file__)
+
+# Plan sources: one data file per plan variant (see load_plan)
+PLANS_DIR = os.path.join(os.path.dirname(__file__), "plans")
+DEFAULT_PLAN = os.path.join(PLANS_DIR, "postural.json")
 
-# Cache downloaded images to avoid re-downloading
+# Content-addressed cache of downloaded images (see ImageCache)
 CACHE_DIR = os.path.join(os.path.dirname(__file__), ".img_cache")
 
+# Serialized routines from earlier runs (see BuildCache)
+BUILD_CACHE_DIR = os.path.join(os.path.dirname(__file__), ".build_cache")
+
+
+# Base64 chunks must start on a 3-byte boundary to concatenate cleanly
+B64_CHUNK_BYTES = 3 * 16 * 1024
+
+
+class Stats:
+    """Per-phase timings, byte counts and cache counters for --stats."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phases = {}
+        self.counters = dict.fromkeys(("hits", "misses", "revalidated", "retries", "failures"), 0)
+        self.urls = []
+
+    def add(self, phase: str, seconds: float, nbytes: int = 0):
+        with self._lock:
+            calls, total, size = self.phases.get(phase, (0, 0.0, 0))
+            self.phases[phase] = (calls + 1, total + seconds, size + nbytes)
+
+    def count(self, counter: str):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def fetched(self, url: str, seconds: float, nbytes: int):
+        with self._lock:
+            self.urls.append((seconds, nbytes, url))
+
+    def merge(self, report: dict):
+        """Add a report() from another process, such as a compile worker."""
+        with self._lock:
+            for phase, row in report["phases"].items():
+                calls, total, size = self.phases.get(phase, (0, 0.0, 0))
+                self.phases[phase] = (calls + row["calls"], total + row["seconds"],
+                                      size + row["bytes"])
+            for counter, value in report["cache"].items():
+                self.counters[counter] += value
+            self.urls.extend((row["seconds"], row["bytes"], row["url"])
+                             for row in report["slowestUrls"])
+
+    def report(self, slowest: int = 10) -> dict:
+        return {
+            "phases": {
+                phase: {"calls": calls, "seconds": round(seconds, 6), "bytes": size}
+                for phase, (calls, seconds, size) in self.phases.items()
+            },
+            "cache": dict(self.counters),
+            "slowestUrls": [
+                {"url": url, "seconds": round(seconds, 6), "bytes": size}
+                for seconds, size, url in sorted(self.urls, reverse=True)[:slowest]
+            ],
+        }
+
+    def print_table(self, slowest: int = 5):
+        report = self.report(slowest)
+        print(f"\n  {'Phase':<18} {'Calls':>6} {'Time':>11} {'Bytes':>11}")
+        for phase, row in report["phases"].items():
+            print(f"  {phase:<18} {row['calls']:>6} {row['seconds'] * 1000:>8.1f} ms "
+                  f"{row['bytes'] / 1024:>8.1f} KB")
+        cache = report["cache"]
+        print(f"\n  Cache: {cache['hits']} hit(s), {cache['misses']} miss(es), "
+              f"{cache['revalidated']} revalidated, {cache['retries']} retried, "
+              f"{cache['failures']} failure(s)")
+        if report["slowestUrls"]:
+            print("  Slowest URLs:")
+            for row in report["slowestUrls"]:
+                print(f"    {row['seconds'] * 1000:>8.1f} ms  {row['url'][:90]}")
+
+
+# Set by --stats; every probe is skipped while it is None
+_stats = None
+
+
+def _record(phase: str, start: float, nbytes: int = 0):
+    if _stats:
+        _stats.add(phase, time.perf_counter() - start, nbytes)
+
+
+def _b64encode(data: bytes) -> str:
+    if _stats is None:
+        return base64.b64encode(data).decode("ascii")
+    start = time.perf_counter()
+    encoded = base64.b64encode(data).decode("ascii")
+    _stats.add("base64", time.perf_counter() - start, len(data))
+    return encoded
+
+
+class ImageRef:
+    """A distinct image file, identified by the SHA-256 of its bytes.
+
+    The bytes stay on disk; they are read when encoded, either all at once
+    (b64, cached) or in chunks (iter_b64) by the streaming writer.
+    Subclasses keep the bytes elsewhere and override open().
+    """
+
+    __slots__ = ("digest", "path", "size", "_b64")
+
+    def __init__(self, path: str, digest: str = None, size: int = None):
+        if digest is None:
+            digest = _mmap_digest(path)
+        self.digest = digest
+        self.path = path
+        self.size = os.path.getsize(path) if size is None else size
+        self._b64 = None
+
+    def open(self):
+        return open(self.path, "rb")
+
+    @property
+    def data(self) -> bytes:
+        with self.open() as f:
+            return f.read()
+
+    @property
+    def b64(self) -> str:
+        if self._b64 is None:
+            self._b64 = _b64encode(self.data)
+        return self._b64
+
+    def iter_b64(self):
+        if self._b64 is not None:
+            yield self._b64
+            return
+        with self.open() as f:
+            while chunk := f.read(B64_CHUNK_BYTES):
+                yield _b64encode(chunk)
+
+
+# Loaded images by source (URL or local filename) and by content digest,
+# so every image is read and encoded at most once per run.
+_images_by_source = {}
+_images_by_digest = {}
+
 
 def load_local_image(filename: str) -> str:
     path = os.path.join(LOCAL_IMG_DIR, filename)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Local image not found: {path}")
+    return path
+
+
+def _temp_path(path: str) -> str:
+    """A temporary name next to path that no other process or thread uses."""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def _save_json_atomic(path: str, obj, ensure_ascii: bool = True):
+    """Write obj to path as indented, key-sorted JSON, replacing it in one step."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = _temp_path(path)
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(obj, f, indent=2, sort_keys=True, ensure_ascii=ensure_ascii)
+            f.write("\n")
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# Digests of local image files from earlier runs (see LocalIndex)
+LOCAL_INDEX_VERSION = 1
+
+
+class LocalIndex:
+    """SHA-256 of every local image file, keyed by path, cached across runs.
+
+    Each entry records the mtime and size the file had when it was hashed;
+    a file that still has both is not read again.
+    """
+
+    # A file modified within this many seconds of being hashed could change
+    # again without its mtime moving, so its digest is not kept
+    RACY_SECONDS = 2
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        self._dirty = False
+        if os.path.exists(path):
+            with open(path) as f:
+                stored = json.load(f)
+            if stored.get("version") == LOCAL_INDEX_VERSION:
+                self.entries = stored["entries"]
+
+    def lookup(self, path: str, st: os.stat_result):
+        entry = self.entries.get(path)
+        if entry and entry["mtimeNs"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            return entry["hash"]
+        return None
+
+    def record(self, path: str, st: os.stat_result, digest: str):
+        if time.time_ns() - st.st_mtime_ns < self.RACY_SECONDS * 10**9:
+            self.entries.pop(path, None)
+        else:
+            self.entries[path] = {"mtimeNs": st.st_mtime_ns, "size": st.st_size, "hash": digest}
+        self._dirty = True
+
+    def save(self):
+        """Write the index, dropping entries for files that no longer exist."""
+        for path in [path for path in self.entries if not os.path.exists(path)]:
+            del self.entries[path]
+            self._dirty = True
+        if not self._dirty:
+            return
+        _save_json_atomic(self.path, {"version": LOCAL_INDEX_VERSION, "entries": self.entries})
+        self._dirty = False
+
+
+def _mmap_digest(path: str) -> str:
+    """SHA-256 of a file, hashed from a memory map without copying it into Python."""
     with open(path, "rb") as f:
-        return base64.b64encode(f.read()).decode("ascii")
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.sha256(mapped).hexdigest()
+
+
+def ingest_local_images(sources, workers: int = 8):
+    """Load every LOCAL_IMG_DIR file among sources that is not loaded yet.
+
+    The directory is listed once, and every missing file is reported in a
+    single FileNotFoundError before any file is read. Files unchanged since
+    an earlier run (same mtime and size) take their digest from the
+    LocalIndex; the rest are hashed from memory maps on a thread pool, where
+    hashlib releases the GIL. Base64 encoding stays with the writers, which
+    stream it and skip unchanged routines entirely.
+    """
+    names = [s for s in dict.fromkeys(sources)
+             if not s.startswith("http") and s not in _images_by_source]
+    if not names:
+        return
+    start = time.perf_counter()
+    try:
+        with os.scandir(LOCAL_IMG_DIR) as it:
+            listing = {entry.name: entry for entry in it}
+    except FileNotFoundError:
+        listing = {}
+
+    found, missing = {}, []
+    for name in names:
+        path = os.path.join(LOCAL_IMG_DIR, name)
+        entry = listing.get(name)
+        try:
+            # Names in subdirectories, or spelled in another case, are not in the listing
+            st = entry.stat() if entry else os.stat(path)
+        except FileNotFoundError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
+            missing.append(name)
+        else:
+            found[name] = (path, st)
+    if missing:
+        raise FileNotFoundError(
+            f"{len(missing)} local image(s) not found in {LOCAL_IMG_DIR}: {', '.join(missing)}")
 
+    index = LocalIndex(os.path.join(CACHE_DIR, "local.json"))
+    digests = {name: index.lookup(path, st) for name, (path, st) in found.items()}
+    pending = [name for name, digest in digests.items() if digest is None]
+    if pending:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            hashed = pool.map(_mmap_digest, [found[name][0] for name in pending])
+            for name, digest in zip(pending, hashed):
+                path, st = found[name]
+                index.record(path, st, digest)
+                digests[name] = digest
+    index.save()
 
-def download_image(url: str) -> str:
-    os.makedirs(CACHE_DIR, exist_ok=True)
-    cache_key = base64.urlsafe_b64encode(url.encode()).decode("ascii")[:80]
-    cache_path = os.path.join(CACHE_DIR, cache_key)
+    for name, (path, st) in found.items():
+        ref = ImageRef(path, digest=digests[name], size=st.st_size)
+        _images_by_source[name] = _images_by_digest.setdefault(ref.digest, ref)
+    if _stats:
+        _stats.add("ingest_local", time.perf_counter() - start,
+                   sum(found[name][1].st_size for name in pending))
 
-    if os.path.exists(cache_path):
-        with open(cache_path, "rb") as f:
-            return base64.b64encode(f.read()).decode("ascii")
 
-    print(f"  Downloading: {url[:80]}...")
-    req = urllib.request.Request(url, headers={
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)"
-    })
+def _connection_dropped(conn) -> bool:
+    """Whether an idle keep-alive connection has been closed by the server.
+
+    An idle connection has nothing to read unless the server has hung up
+    (or sent something unsolicited, which is just as unusable).
+    """
+    if conn.sock is None:
+        return True
     try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            data = resp.read()
-        with open(cache_path, "wb") as f:
-            f.write(data)
-        return base64.b64encode(data).decode("ascii")
+        return bool(select.select([conn.sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+def _proxy_for(scheme: str, host: str):
+    """The proxy URL to reach host over scheme, or None.
+
+    Honours the same settings as urllib.request.urlopen: http_proxy,
+    https_proxy and no_proxy, or the system settings on macOS and Windows.
+    """
+    proxy = urllib.request.getproxies().get(scheme)
+    if not proxy or urllib.request.proxy_bypass(host):
+        return None
+    return proxy if "://" in proxy else f"http://{proxy}"
+
+
+def _proxy_headers(proxy_parts) -> dict:
+    """Proxy-Authorization for credentials in a proxy URL."""
+    if proxy_parts.username is None:
+        return {}
+    credentials = (f"{urllib.parse.unquote(proxy_parts.username)}:"
+                   f"{urllib.parse.unquote(proxy_parts.password or '')}")
+    token = base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+    return {"Proxy-Authorization": f"Basic {token}"}
+
+
+class HostPool:
+    """Keep-alive HTTP(S) connections with a concurrency limit per host.
+
+    Requests go through the configured proxy, if any (see _proxy_for):
+    plain HTTP as absolute-URL requests to it, HTTPS through a CONNECT
+    tunnel.
+    """
+
+    def __init__(self, per_host: int = 4):
+        self.per_host = per_host
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._slots = {}
+
+    def _host_state(self, key):
+        with self._lock:
+            if key not in self._slots:
+                self._slots[key] = threading.BoundedSemaphore(self.per_host)
+                self._idle[key] = []
+            return self._slots[key], self._idle[key]
+
+    @staticmethod
+    def _connect(parts, proxy_parts, timeout: float):
+        conn_cls = (http.client.HTTPSConnection if parts.scheme == "https"
+                    else http.client.HTTPConnection)
+        if proxy_parts is None:
+            return conn_cls(parts.netloc, timeout=timeout)
+        conn = conn_cls(proxy_parts.hostname, proxy_parts.port or 80, timeout=timeout)
+        if parts.scheme == "https":
+            conn.set_tunnel(parts.hostname, parts.port, headers=_proxy_headers(proxy_parts))
+        return conn
+
+    def get(self, url: str, headers: dict, timeout: float):
+        """Perform a GET and return (status, headers, body)."""
+        parts = urllib.parse.urlsplit(url)
+        proxy = _proxy_for(parts.scheme, parts.hostname or "")
+        key = (parts.scheme, parts.netloc, proxy)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        # http.client sends the path as ASCII; escape anything else, such as
+        # accented file names, and leave existing escapes alone
+        path = urllib.parse.quote(path, safe="/%?=&:@!$'()*+,;~")
+        proxy_parts = urllib.parse.urlsplit(proxy) if proxy else None
+        if proxy_parts and parts.scheme == "http":
+            path = f"http://{parts.netloc}{path}"
+            headers = {**headers, **_proxy_headers(proxy_parts)}
+
+        slots, idle = self._host_state(key)
+        with slots:
+            conn = None
+            with self._lock:
+                while idle and conn is None:
+                    conn = idle.pop()
+                    if _connection_dropped(conn):
+                        conn.close()
+                        conn = None
+            reused = conn is not None
+            if reused:
+                conn.sock.settimeout(timeout)
+            while True:
+                if conn is None:
+                    conn = self._connect(parts, proxy_parts, timeout)
+                sent = False
+                try:
+                    conn.request("GET", path, headers=headers)
+                    sent = True
+                    resp = conn.getresponse()
+                    body = resp.read()
+                    break
+                except ConnectionError:
+                    conn.close()
+                    # Idle connections the server has closed are weeded out
+                    # above; one closed since breaks while the request is
+                    # sent, and is retried once on a fresh connection. Once
+                    # the request is out, a hang-up or reset is the server
+                    # failing it, and like a truncated body it is left to
+                    # fetch_with_retry.
+                    if not reused or sent:
+                        raise
+                    conn, reused = None, False
+                except Exception:
+                    conn.close()
+                    raise
+
+            if resp.will_close:
+                conn.close()
+            else:
+                with self._lock:
+                    idle.append(conn)
+            return resp.status, resp.headers, body
+
+
+_http_pool = HostPool()
+_failed_downloads = set()
+
+
+class HTTPStatusError(OSError):
+    """An error response; retry_after is its Retry-After delay in seconds, if given."""
+
+    def __init__(self, status: int, retry_after: float = None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+# Rate limiting and transient server errors; anything else >= 400 is final
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class RetryPolicy:
+    """Per-request timeout, retries with exponential backoff, and an overall deadline."""
+
+    def __init__(self, retries: int = 3, backoff: float = 0.5, max_backoff: float = 8.0,
+                 timeout: float = 15.0):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        # time.monotonic() after which no attempt starts (see prefetch_images)
+        self.deadline = None
+
+    def remaining(self):
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait before retry number attempt + 1: full backoff with jitter."""
+        return min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+_retry_policy = RetryPolicy()
+
+
+def fetch_url(url: str, headers: dict = None, max_redirects: int = 5, timeout: float = 15):
+    """GET url, following redirects. Returns (status, headers, body)."""
+    headers = {"User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)", **(headers or {})}
+    for _ in range(max_redirects + 1):
+        status, resp_headers, body = _http_pool.get(url, headers, timeout=timeout)
+        if status in (301, 302, 303, 307, 308) and resp_headers.get("Location"):
+            url = urllib.parse.urljoin(url, resp_headers["Location"])
+            continue
+        if status >= 400:
+            retry_after = resp_headers.get("Retry-After", "")
+            raise HTTPStatusError(status, float(retry_after) if retry_after.isdigit() else None)
+        return status, resp_headers, body
+    raise OSError("too many redirects")
+
+
+def fetch_with_retry(url: str, headers: dict = None, policy: RetryPolicy = None):
+    """fetch_url() that retries transient failures with exponential backoff.
+
+    Connection errors, timeouts, truncated bodies and RETRY_STATUSES are
+    retried up to policy.retries times, waiting Retry-After if the server
+    sent one and a jittered exponential backoff otherwise. A Retry-After
+    longer than policy.max_backoff makes the failure final rather than
+    stalling the run. No attempt starts, and no request or wait runs, past
+    policy.deadline.
+    """
+    policy = policy or _retry_policy
+    attempt = 0
+    while True:
+        remaining = policy.remaining()
+        if remaining is not None and remaining <= 0:
+            raise TimeoutError("fetch time budget exhausted")
+        timeout = policy.timeout if remaining is None else min(policy.timeout, remaining)
+        try:
+            return fetch_url(url, headers, timeout=timeout)
+        except (OSError, http.client.HTTPException) as e:
+            if isinstance(e, HTTPStatusError) and e.status not in RETRY_STATUSES:
+                raise
+            delay = getattr(e, "retry_after", None)
+            if delay is None:
+                delay = policy.delay(attempt)
+            remaining = policy.remaining()
+            if (attempt >= policy.retries or delay > policy.max_backoff
+                    or (remaining is not None and delay >= remaining)):
+                raise
+        if _stats:
+            _stats.count("retries")
+        time.sleep(delay)
+        attempt += 1
+
+
+def sniff_mime(data: bytes) -> str:
+    """Guess an image MIME type from its leading bytes."""
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+def image_problem(data: bytes, mime_type: str = None):
+    """Return why data is not a complete image of mime_type, or None if it is.
+
+    JPEG, PNG, GIF and WebP have their container structure checked (a
+    truncated download loses its end marker). Every image is then decoded
+    fully when Pillow is installed; without Pillow, other formats such as
+    BMP, TIFF or HEIC are accepted as they are.
+    """
+    actual = sniff_mime(data[:16])
+    if actual != "application/octet-stream":
+        if mime_type and mime_type != actual:
+            return f"claims {mime_type} but is {actual}"
+        if actual == "image/jpeg":
+            # 0xFFD9 cannot occur inside entropy-coded data, only as the end marker
+            complete = b"\xff\xd9" in data[-4096:]
+        elif actual == "image/png":
+            complete = data.endswith(b"IEND\xaeB`\x82")
+        elif actual == "image/gif":
+            complete = data.rstrip(b"\x00").endswith(b";")
+        else:
+            complete = struct.unpack("<I", data[4:8])[0] + 8 <= len(data)
+        if not complete:
+            return "truncated"
+
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            im.load()
     except Exception as e:
+        return f"does not decode: {e}"
+    return None
+
+
+def _utc_timestamp(seconds: float = None) -> str:
+    return datetime.datetime.fromtimestamp(
+        time.time() if seconds is None else seconds, datetime.timezone.utc
+    ).isoformat(timespec="seconds")
+
+
+class ImageCache:
+    """Content-addressed store for downloaded images.
+
+    Bodies live in objects/ named by their SHA-256. index.json maps each URL
+    to the object hash plus size, MIME type, HTTP validators (ETag,
+    Last-Modified) and fetch time, so a cache probe is a dict lookup and
+    cached entries can be revalidated with conditional requests.
+
+    Files are written under a temporary name and renamed into place, so a
+    crash never leaves a partial object. Every object a run uses has its
+    mtime refreshed; gc() evicts the least recently used files first.
+    """
+
+    INDEX_VERSION = 1
+    # Unreferenced objects and temp files younger than this are left alone
+    ORPHAN_GRACE_SECONDS = 3600
+
+    def __init__(self, root: str):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.index_path = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.used = set()
+        self.entries = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                self.entries = json.load(f).get("entries", {})
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest)
+
+    def lookup(self, url: str):
+        """Return the object path cached for url, or None.
+
+        An entry whose object file has gone missing is discarded, so the
+        URL is downloaded again like any other miss.
+        """
+        entry = self.entries.get(url)
+        if not entry:
+            return None
+        path = self.object_path(entry["hash"])
+        if not os.path.isfile(path):
+            self.discard(url)
+            return None
+        self.mark_used(path)
+        return path
+
+    def mark_used(self, path: str):
+        """Refresh the LRU time of path, once per run."""
+        with self._lock:
+            if path in self.used:
+                return
+            self.used.add(path)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def validators(self, url: str) -> dict:
+        """Conditional request headers for revalidating url."""
+        entry = self.entries.get(url) or {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("lastModified"):
+            headers["If-Modified-Since"] = entry["lastModified"]
+        return headers
+
+    def store(self, url: str, data: bytes, headers=None, fetched_at: float = None) -> str:
+        """Add data as the body of url and return its object path."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(self.objects_dir, exist_ok=True)
+            tmp_path = _temp_path(path)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        self.mark_used(path)
+
+        headers = headers or {}
+        content_type = (headers.get("Content-Type") or "").split(";")[0].strip()
+        mime_type = sniff_mime(data[:16])
+        if mime_type == "application/octet-stream" and content_type.startswith("image/"):
+            mime_type = content_type
+        entry = {
+            "hash": digest,
+            "size": len(data),
+            "mimeType": mime_type,
+            "etag": headers.get("ETag"),
+            "lastModified": headers.get("Last-Modified"),
+            "fetchedAt": _utc_timestamp(fetched_at),
+        }
+        with self._lock:
+            self.entries[url] = entry
+            self._dirty = True
+        return path
+
+    def touch(self, url: str, headers):
+        """Record a successful revalidation (304 Not Modified) of url."""
+        with self._lock:
+            entry = self.entries[url]
+            entry["etag"] = headers.get("ETag") or entry.get("etag")
+            entry["lastModified"] = headers.get("Last-Modified") or entry.get("lastModified")
+            entry["fetchedAt"] = _utc_timestamp()
+            self._dirty = True
+
+    def discard(self, url: str):
+        """Forget url; gc() removes its object once nothing else uses it."""
+        with self._lock:
+            if self.entries.pop(url, None):
+                self._dirty = True
+
+    def check(self) -> list:
+        """Verify every cached object and discard the URLs of bad ones.
+
+        An object is bad if it is missing, its bytes no longer match its
+        hash, or it is not a complete image of the type its entry claims.
+        Returns a list of (url, problem).
+        """
+        problems = []
+        for url, entry in list(self.entries.items()):
+            path = self.object_path(entry["hash"])
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                problems.append((url, "missing"))
+                continue
+            if hashlib.sha256(data).hexdigest() != entry["hash"]:
+                problem = "content does not match its hash"
+            else:
+                problem = image_problem(data, entry.get("mimeType"))
+            if problem:
+                problems.append((url, problem))
+                os.remove(path)
+        for url, _ in problems:
+            self.discard(url)
+        return problems
+
+    def prune(self, urls) -> int:
+        """Forget every URL not in urls and delete normalized images this run did not use.
+
+        Returns the number of URLs forgotten; gc() then removes their objects.
+        """
+        urls = set(urls)
+        with self._lock:
+            stale = [url for url in self.entries if url not in urls]
+            for url in stale:
+                del self.entries[url]
+            self._dirty = self._dirty or bool(stale)
+        normalized_dir = os.path.join(self.root, "normalized")
+        if os.path.isdir(normalized_dir):
+            for entry in os.scandir(normalized_dir):
+                if entry.is_file() and entry.path not in self.used:
+                    os.remove(entry.path)
+        return len(stale)
+
+    def gc(self, max_bytes: int = None):
+        """Delete orphaned objects and stale temp files, then enforce max_bytes.
+
+        Objects no URL refers to and temp files are removed once they are
+        older than ORPHAN_GRACE_SECONDS: a younger one may belong to another
+        run that has stored it but not yet saved its index. If objects/ and
+        normalized/ together still exceed max_bytes, the least recently used
+        files go first; files used by this run are never evicted.
+        Returns (files removed, bytes freed).
+        """
+        referenced = {entry["hash"] for entry in self.entries.values()}
+        stale_before = time.time() - self.ORPHAN_GRACE_SECONDS
+        files = []
+        removed = freed = 0
+        for directory in (self.objects_dir, os.path.join(self.root, "normalized")):
+            if not os.path.isdir(directory):
+                continue
+            for entry in os.scandir(directory):
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+                unreferenced = entry.name.endswith(".tmp") or (
+                    directory == self.objects_dir and entry.name not in referenced)
+                if not unreferenced:
+                    files.append((st.st_mtime, st.st_size, entry.path))
+                elif st.st_mtime < stale_before:
+                    os.remove(entry.path)
+                    removed += 1
+                    freed += st.st_size
+
+        total = sum(size for _, size, _ in files)
+        if max_bytes is not None:
+            evicted = set()
+            for _, size, path in sorted(files):
+                if total <= max_bytes:
+                    break
+                if path in self.used:
+                    continue
+                os.remove(path)
+                total -= size
+                removed += 1
+                freed += size
+                if os.path.dirname(path) == self.objects_dir:
+                    evicted.add(os.path.basename(path))
+            if evicted:
+                with self._lock:
+                    for url in [u for u, e in self.entries.items() if e["hash"] in evicted]:
+                        del self.entries[url]
+                    self._dirty = True
+        return removed, freed
+
+    def migrate_legacy(self, urls) -> int:
+        """Move files from the old URL-prefix cache layout into the store.
+
+        Legacy names were the first 80 characters of the URL-safe Base64 of
+        the URL, so URLs sharing a long prefix collided. A legacy file is
+        only adopted when exactly one of urls maps to it; anything else is
+        left for a fresh download.
+        """
+        by_key = {}
+        for url in dict.fromkeys(urls):
+            if url not in self.entries:
+                key = base64.urlsafe_b64encode(url.encode()).decode("ascii")[:80]
+                by_key.setdefault(key, []).append(url)
+
+        migrated = 0
+        for key, key_urls in by_key.items():
+            legacy_path = os.path.join(self.root, key)
+            if len(key_urls) != 1 or not os.path.isfile(legacy_path):
+                continue
+            with open(legacy_path, "rb") as f:
+                data = f.read()
+            self.store(key_urls[0], data, fetched_at=os.path.getmtime(legacy_path))
+            os.remove(legacy_path)
+            migrated += 1
+        if migrated:
+            print(f"Migrated {migrated} legacy cache entr{'y' if migrated == 1 else 'ies'}")
+        return migrated
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            _save_json_atomic(self.index_path,
+                              {"version": self.INDEX_VERSION, "entries": self.entries})
+            self._dirty = False
+
+
+_image_cache = None
+
+
+def image_cache() -> ImageCache:
+    """The ImageCache rooted at CACHE_DIR, opened on first use."""
+    global _image_cache
+    if _image_cache is None or _image_cache.root != CACHE_DIR:
+        _image_cache = ImageCache(CACHE_DIR)
+    return _image_cache
+
+
+def download_image(url: str, revalidate: bool = False):
+    """Return the cache path for url, downloading it if needed, or None on failure.
+
+    With revalidate, a cached copy is checked against the server with a
+    conditional request and replaced if it changed.
+    """
+    cache = image_cache()
+    cache_path = cache.lookup(url)
+
+    if cache_path and not revalidate:
+        if _stats:
+            _stats.count("hits")
+        return cache_path
+    if url in _failed_downloads:
+        return cache_path
+
+    headers = cache.validators(url) if cache_path else {}
+    print(f"  {'Revalidating' if cache_path else 'Downloading'}: {url[:80]}...")
+    start = time.perf_counter()
+    try:
+        status, resp_headers, data = fetch_with_retry(url, headers)
+    except (OSError, http.client.HTTPException, ValueError) as e:
+        # ValueError covers URLs http.client cannot encode or parse
         print(f"  WARNING: Failed to download {url}: {e}")
-        return ""
+        _failed_downloads.add(url)
+        if _stats:
+            _stats.count("failures")
+        return cache_path
 
+    if _stats:
+        elapsed = time.perf_counter() - start
+        _stats.add("download_image", elapsed, len(data))
+        _stats.fetched(url, elapsed, len(data))
+        _stats.count("revalidated" if status == 304 else "misses")
+    if status == 304 and cache_path:
+        cache.touch(url, resp_headers)
+        return cache_path
+    problem = image_problem(data)
+    if problem:
+        print(f"  WARNING: Discarding download of {url}: {problem}")
+        _failed_downloads.add(url)
+        if _stats:
+            _stats.count("failures")
+        return cache_path
+    return cache.store(url, data, resp_headers)
+
+
+def prefetch_images(sources, workers: int = 8, per_host: int = 4, revalidate: bool = False,
+                    budget: float = None):
+    """Download every uncached URL among sources concurrently.
+
+    With revalidate, every cached URL is also checked with a conditional request.
+    With budget, downloads and retries stop after that many seconds; what is
+    not fetched by then counts as failed.
+    """
+    _http_pool.per_host = per_host
+    cache = image_cache()
+    urls = [s for s in dict.fromkeys(sources) if s.startswith("http")]
+    cache.migrate_legacy(urls)
+
+    targets = [u for u in urls if revalidate or cache.lookup(u) is None]
+    if targets:
+        print(f"Fetching {len(targets)} image(s) with {workers} worker(s)...")
+        _retry_policy.deadline = time.monotonic() + budget if budget else None
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(functools.partial(download_image, revalidate=revalidate), targets))
+        finally:
+            _retry_policy.deadline = None
+    cache.save()
+
+
+def load_image(source: str):
+    """Return the ImageRef for a URL or local filename, or None if unavailable."""
+    if source in _images_by_source:
+        return _images_by_source[source]
 
-def img(source: str) -> list:
-    """Return a list with one Base64-encoded image string."""
     if source.startswith("http"):
-        b64 = download_image(source)
+        path = download_image(source)
+        phase = "read_cache"
+        start = time.perf_counter() if _stats else 0.0
     else:
-        b64 = load_local_image(source)
-    return [b64] if b64 else []
+        start = time.perf_counter() if _stats else 0.0
+        path = load_local_image(source)
+        phase = "load_local_image"
+
+    try:
+        ref = ImageRef(path) if path else None
+    except FileNotFoundError:
+        if phase != "read_cache":
+            raise
+        # The object was deleted after lookup() found it; fetch it again
+        print(f"  WARNING: Cached copy of {source[:80]} is missing; downloading again")
+        image_cache().discard(source)
+        path = download_image(source)
+        ref = ImageRef(path) if path else None
+    if ref and phase == "read_cache" and ref.digest != os.path.basename(path):
+        # The object changed on disk after it was stored; fetch a fresh copy
+        print(f"  WARNING: Cached copy of {source[:80]} is corrupt; downloading again")
+        os.remove(path)
+        image_cache().discard(source)
+        path = download_image(source)
+        ref = ImageRef(path) if path else None
+    if ref:
+        ref = _images_by_digest.setdefault(ref.digest, ref)
+        if _stats:
+            _stats.add(phase, time.perf_counter() - start, ref.size)
+    _images_by_source[source] = ref
+    return ref
+
+
+def img(source: str) -> list:
+    """Return a list with one image reference."""
+    ref = load_image(source)
+    return [ref] if ref else []
+
+
+NORMALIZE_VERSION = 2
+NORMALIZED_FORMATS = {"jpeg": "JPEG", "webp": "WEBP", "png": "PNG"}
+
+
+def exercise_images(ex) -> list:
+    """Every image of an exercise: "images", then each of its "imageVariants"."""
+    images = list(ex.get("images", []))
+    for refs in ex.get("imageVariants", {}).values():
+        images.extend(refs)
+    return images
+
+
+def distinct_images(data) -> dict:
+    """Map digest -> ImageRef for every image in data, in first-use order."""
+    return {
+        ref.digest: ref
+        for routine in data["routines"]
+        for ex in routine["exercises"]
+        for ref in exercise_images(ex)
+    }
+
+
+def _map_exercise_images(ex, fn):
+    if "images" not in ex:
+        return ex
+    ex = {**ex, "images": [fn(ref) for ref in ex["images"]]}
+    if "imageVariants" in ex:
+        ex["imageVariants"] = {
+            name: [fn(ref) for ref in refs] for name, refs in ex["imageVariants"].items()
+        }
+    return ex
+
+
+def map_images(data, fn):
+    """Return a copy of data with every exercise image (variants included) replaced by fn(image)."""
+    return {
+        **data,
+        "routines": [
+            {
+                **routine,
+                "exercises": [_map_exercise_images(ex, fn) for ex in routine["exercises"]],
+            }
+            for routine in data["routines"]
+        ],
+    }
+
+
+def add_image_variants(data, variants: dict):
+    """Return a copy of data where every exercise with images also has "imageVariants".
+
+    variants maps a variant name to {source digest -> ImageRef}. The new
+    field follows "images" and holds, per variant, a list parallel to it;
+    readers that do not know the field keep using "images".
+    """
+    routines = []
+    for routine in data["routines"]:
+        exercises = []
+        for ex in routine["exercises"]:
+            entry = {}
+            for key, value in ex.items():
+                entry[key] = value
+                if key == "images" and value:
+                    entry["imageVariants"] = {
+                        name: [refs[ref.digest] for ref in value] for name, refs in variants.items()
+                    }
+            exercises.append(entry)
+        routines.append({**routine, "exercises": exercises})
+    return {**data, "routines": routines}
+
+
+# Image.info keys that hold metadata rather than encoding parameters
+_METADATA_KEYS = ("exif", "icc_profile", "comment", "xmp", "XML:com.adobe.xmp", "photoshop")
+
+
+def _has_metadata(im) -> bool:
+    """Whether im carries EXIF, an ICC profile, comments, XMP or PNG text."""
+    return bool(im.getexif() or getattr(im, "text", None)
+                or any(key in im.info for key in _METADATA_KEYS))
+
+
+def normalize_image(src_path: str, dest_path: str, max_size: int, fmt: str, quality: int):
+    """Downscale and re-encode one image file without metadata.
+
+    The image is fitted within max_size x max_size and saved as fmt with no
+    EXIF, ICC profile or comments. The original bytes are kept only if the
+    original is already fmt, carries no metadata, needs no downscale and
+    re-encoding would not make it smaller. Runs in a worker process.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(src_path) as im:
+        reusable = im.format == NORMALIZED_FORMATS[fmt] and not _has_metadata(im)
+        im = ImageOps.exif_transpose(im)
+        # Pillow carries EXIF, ICC profiles and JPEG comments over from info
+        im.info.clear()
+        resized = max(im.size) > max_size
+        if resized:
+            im.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        if fmt == "jpeg" and im.mode not in ("RGB", "L"):
+            rgba = im.convert("RGBA")
+            im = Image.new("RGB", rgba.size, (255, 255, 255))
+            im.paste(rgba, mask=rgba.getchannel("A"))
+        buf = io.BytesIO()
+        options = {"optimize": True}
+        if fmt in ("jpeg", "webp"):
+            options["quality"] = quality
+        im.save(buf, NORMALIZED_FORMATS[fmt], **options)
+
+    data = buf.getvalue()
+    if reusable and not resized and len(data) >= os.path.getsize(src_path):
+        with open(src_path, "rb") as f:
+            data = f.read()
+    tmp_path = _temp_path(dest_path)
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, dest_path)
+    return dest_path
+
+
+def normalize_images(sources: dict, max_sizes=(720,), fmt: str = "jpeg", quality: int = 80,
+                     workers: int = None) -> dict:
+    """Normalize each digest -> ImageRef in sources at every size in max_sizes.
+
+    Returns {max_size: {digest: normalized ImageRef}}. All sizes of all
+    images are processed in one process pool. Results are kept in
+    CACHE_DIR/normalized keyed by source hash and settings, so unchanged
+    images are not reprocessed on later runs.
+    """
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        sys.exit("Image normalization requires Pillow (pip install Pillow)")
+
+    out_dir = os.path.join(CACHE_DIR, "normalized")
+    os.makedirs(out_dir, exist_ok=True)
+
+    dest = {}
+    for max_size in dict.fromkeys(max_sizes):
+        settings = f"v{NORMALIZE_VERSION}-{max_size}-{fmt}-q{quality}"
+        for digest in sources:
+            dest[max_size, digest] = os.path.join(out_dir, f"{digest}-{settings}")
+    pending = [key for key, path in dest.items() if not os.path.exists(path)]
+    if pending:
+        print(f"Normalizing {len(pending)} image(s) "
+              f"({', '.join(map(str, dict.fromkeys(max_sizes)))} px, {fmt}, q{quality})...")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(normalize_image, sources[digest].path, dest[max_size, digest],
+                            max_size, fmt, quality)
+                for max_size, digest in pending
+            ]
+            for future in futures:
+                future.result()
+
+    normalized = {max_size: {} for max_size in max_sizes}
+    for (max_size, digest), path in dest.items():
+        image_cache().mark_used(path)
+        ref = ImageRef(path)
+        normalized[max_size][digest] = _images_by_digest.setdefault(ref.digest, ref)
+    return normalized
+
+
+# Perceptual hashes: a 64-bit dHash per image, kept in CACHE_DIR/phash.json
+PHASH_VERSION = 1
+PHASH_SIZE = 8
+# A re-encoded or resized copy differs in about 2 bits; distinct line drawings
+# start around 4, so the default stays clear of them
+SIMILAR_DISTANCE = 2
+
+
+def _gray_thumbnail(path: str):
+    """Decode path to a (PHASH_SIZE + 1) x PHASH_SIZE grayscale thumbnail.
+
+    Returns (pixels, width, height). Runs in a worker process.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as im:
+        width, height = im.size
+        im.draft("L", (PHASH_SIZE * 4, PHASH_SIZE * 4))
+        im = ImageOps.exif_transpose(im)
+        if im.mode in ("RGBA", "LA", "P"):
+            # Transparent areas are white on screen, not black
+            rgba = im.convert("RGBA")
+            im = Image.new("RGB", rgba.size, (255, 255, 255))
+            im.paste(rgba, mask=rgba.getchannel("A"))
+        small = im.convert("L").resize((PHASH_SIZE + 1, PHASH_SIZE), Image.Resampling.LANCZOS)
+        return small.tobytes(), width, height
+
+
+class PerceptualIndex:
+    """dHash of every image, by digest, cached across runs.
+
+    A dHash records whether each pixel of a tiny grayscale thumbnail is
+    brighter than its right neighbour, so resized, re-encoded or
+    re-hosted copies of one illustration hash within a few bits of each
+    other. Thumbnails are decoded in a process pool and hashed with NumPy
+    in one vectorized pass; only images missing from the index are decoded.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hashes = {}
+        self._dirty = False
+        if os.path.exists(path):
+            with open(path) as f:
+                stored = json.load(f)
+            if stored.get("version") == PHASH_VERSION:
+                self.hashes = stored["hashes"]
+
+    def update(self, refs: dict, workers: int = None):
+        """Hash every digest -> ImageRef in refs that the index does not have yet."""
+        import numpy as np
+
+        pending = [digest for digest in refs if digest not in self.hashes]
+        if not pending:
+            return
+        print(f"Hashing {len(pending)} image(s) for similarity...")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            thumbs = list(pool.map(_gray_thumbnail, [refs[d].path for d in pending],
+                                   chunksize=16))
+        pixels = np.frombuffer(b"".join(t[0] for t in thumbs), dtype=np.uint8)
+        pixels = pixels.reshape(len(pending), PHASH_SIZE, PHASH_SIZE + 1)
+        bits = np.packbits(pixels[:, :, 1:] > pixels[:, :, :-1], axis=2)
+        for digest, row, (_, width, height) in zip(pending, bits.reshape(len(pending), -1), thumbs):
+            self.hashes[digest] = {"dhash": row.tobytes().hex(), "pixels": width * height}
+        self._dirty = True
+
+    def clusters(self, digests, max_distance: int = SIMILAR_DISTANCE) -> list:
+        """Group digests whose hashes differ in at most max_distance bits (transitively).
+
+        Splits each hash into max_distance + 1 bands: two hashes within
+        max_distance bits must agree exactly on at least one band, so only
+        hashes sharing a band bucket are compared and the work grows with
+        the number of images rather than the number of pairs. Returns lists
+        of two or more digests, best first (most pixels) within each.
+        """
+        digests = [d for d in dict.fromkeys(digests) if d in self.hashes]
+        values = [int(self.hashes[d]["dhash"], 16) for d in digests]
+        bits = PHASH_SIZE * PHASH_SIZE
+        bands = min(max_distance + 1, bits)
+        parent = list(range(len(digests)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for band in range(bands):
+            low, high = band * bits // bands, (band + 1) * bits // bands
+            mask = (1 << (high - low)) - 1
+            buckets = {}
+            for i, value in enumerate(values):
+                buckets.setdefault((value >> low) & mask, []).append(i)
+            for members in buckets.values():
+                for a, i in enumerate(members):
+                    for j in members[a + 1:]:
+                        if find(i) == find(j):
+                            continue
+                        # bin().count() rather than int.bit_count(), which needs 3.10
+                        if bin(values[i] ^ values[j]).count("1") <= max_distance:
+                            parent[find(j)] = find(i)
+
+        groups = {}
+        for i, digest in enumerate(digests):
+            groups.setdefault(find(i), []).append(digest)
+        return [
+            sorted(group, key=lambda d: -self.hashes[d]["pixels"])
+            for group in groups.values() if len(group) > 1
+        ]
+
+    def save(self):
+        if not self._dirty:
+            return
+        _save_json_atomic(self.path, {"version": PHASH_VERSION, "hashes": self.hashes})
+        self._dirty = False
+
+
+def collapse_images(data, canonical: dict):
+    """Replace each image with canonical[digest] where given.
+
+    An exercise that ends up showing the same image twice keeps it once.
+    """
+    routines = []
+    for routine in data["routines"]:
+        exercises = []
+        for ex in routine["exercises"]:
+            if "images" in ex:
+                images = {}
+                for ref in ex["images"]:
+                    ref = canonical.get(ref.digest, ref)
+                    images.setdefault(ref.digest, ref)
+                ex = {**ex, "images": list(images.values())}
+            exercises.append(ex)
+        routines.append({**routine, "exercises": exercises})
+    return {**data, "routines": routines}
 
 
 def exercise(name, sort_order, duration_seconds=0, description="", icon="figure.walk",
@@ -79,423 +1321,206 @@ def exercise(name, sort_order, duration_seconds=0, description="", icon="figure.
     }
 
 
-def build_routines():
-    print("Building postural plan routines...")
-
-    # ===================== FASE 1 =====================
-    fase1 = {
-        "name": "Fase 1 - Movilidad y activacion",
-        "isDefault": False,
-        "intervalMinutes": 45,
-        "isActive": False,
-        "exercises": [
-            exercise(
-                "Foam roller toracico", 0,
-                duration_seconds=120,
-                description="Apoya la parte alta de la espalda sobre el rodillo (de la mitad de la espalda hasta los omoplatos). Brazos cruzados sobre el pecho. Rueda lentamente arriba y abajo.",
-                icon="figure.cooldown",
-                images=img("7753-m-crop.png"),
-                rest_after_seconds=15,
-            ),
-            exercise(
-                "Estiramiento flexores de cadera", 1,
-                duration_seconds=45,
-                description="Rodilla trasera en el suelo. Pie delantero a 90 grados. Aprieta gluteo del lado trasero y avanza la cadera hacia delante. No arquees la lumbar.",
-                icon="figure.flexibility",
-                sets=3, rest_seconds=10, rest_after_seconds=15,
-                images=img("https://spotebi.com/wp-content/uploads/2015/03/hip-flexor-stretch-exercise-illustration.jpg"),
-            ),
-            exercise(
-                "Estiramiento pectoral en puerta", 2,
-                duration_seconds=30,
-                description="De pie en marco de puerta. Antebrazos en los laterales con codos a 90 grados. Avanza un pie y deja que el torso pase entre los brazos.",
-                icon="figure.flexibility",
-                sets=3, rest_seconds=10, rest_after_seconds=15,
-                images=img("https://spotebi.com/wp-content/uploads/2015/06/chest-stretch-exercise-illustration.jpg"),
-            ),
-            exercise(
-                "Chin tucks (retraccion cervical)", 3,
-                description="De pie contra la pared. Lleva la barbilla hacia atras como si hicieras doble papada. Manten 5 segundos cada repeticion.",
-                icon="figure.cooldown",
-                sets=3, rest_seconds=15, rest_after_seconds=15,
-                reps=10, seconds_per_rep=5,
-                images=img("https://www.shutterstock.com/image-vector/chin-tuck-head-text-neck-600nw-2158119513.jpg"),
-            ),
-            exercise(
-                "Cat-cow", 4,
-                description="En cuadrupedia. Inspira arqueando la espalda (cow). Espira redondeando la espalda (cat). Movimiento lento sincronizado con la respiracion.",
-                icon="figure.flexibility",
-                sets=2, rest_seconds=15, rest_after_seconds=15,
-                reps=10, seconds_per_rep=6,
-                images=img("https://spotebi.com/wp-content/uploads/2014/10/cat-back-stretch-exercise-illustration.jpg"),
-            ),
-            exercise(
-                "Glute bridge", 5,
-                description="Tumbado boca arriba, pies apoyados. Empuja con talones para levantar la cadera. Aprieta gluteos arriba 3 segundos. Baja controladamente.",
-                icon="figure.strengthtraining.functional",
-                sets=3, rest_seconds=15, rest_after_seconds=15,
-                reps=15, seconds_per_rep=5,
-                images=img("https://spotebi.com/wp-content/uploads/2015/01/glute-bridge-exercise-illustration.jpg"),
-            ),
-            exercise(
-                "Dead bug", 6,
-                description="Tumbado boca arriba, brazos al techo, rodillas a 90 grados. Extiende un brazo y la pierna contraria lentamente. La espalda baja pegada al suelo.",
-                icon="figure.core.training",
-                sets=3, rest_seconds=15, rest_after_seconds=15,
-                reps=8, seconds_per_rep=6,
-                images=img("https://spotebi.com/wp-content/uploads/2015/05/dead-bug-exercise-illustration.jpg"),
-            ),
-            exercise(
-                "Band pull-apart", 7,
-                description="De pie, banda elastica a la altura del pecho con brazos extendidos. Separa las manos apretando las escapulas. Manten 2 segundos.",
-                icon="figure.strengthtraining.functional",
-                sets=3, rest_seconds=15, rest_after_seconds=15,
-                reps=15, seconds_per_rep=4,
-                images=img("https://spotebi.com/wp-content/uploads/2017/11/resistance-band-mid-back-pull-exercise-illustration-spotebi.jpg"),
-            ),
-            exercise(
-                "Wall slides", 8,
-                description="De pie con espalda, cabeza, codos y munecas contra la pared. Posicion W, sube a Y deslizando por la pared. Baja controladamente.",
-                icon="figure.cooldown",
-                sets=3, rest_seconds=15, rest_after_seconds=0,
-                reps=10, seconds_per_rep=5,
-                images=img("10249-m-crop.png"),
-            ),
-        ],
+def routine(name, exercises, is_default=False, interval_minutes=45, is_active=False):
+    return {
+        "name": name,
+        "isDefault": is_default,
+        "intervalMinutes": interval_minutes,
+        "isActive": is_active,
+        "exercises": exercises,
     }
 
-    # ===================== FASE 2 DIA A =====================
-    fase2_a = {
-        "name": "Fase 2 - Dia A (Cadena posterior)",
-        "isDefault": False,
-        "intervalMinutes": 45,
-        "isActive": False,
-        "exercises": [
-            exercise(
-                "Hip thrust con carga", 0,
-                description="Espalda alta en banco. Barra sobre cadera. Empuja con talones, aprieta gluteos arriba 2 segundos. No hiperextiendas la lumbar.",
-                icon="figure.strengthtraining.functional",
-                sets=4, rest_seconds=60, rest_after_seconds=60,
-                reps=12, seconds_per_rep=5,
-                images=img("6548-m-crop.png"),
-            ),
-            exercise(
-                "Peso muerto rumano (mancuernas)", 1,
-                description="De pie con mancuernas. Empuja caderas hacia atras manteniendo espalda neutra. Baja hasta sentir estiramiento en isquiotibiales. Vuelve apretando gluteos.",
-                icon="figure.strengthtraining.functional",
-                sets=4, rest_seconds=60, rest_after_seconds=60,
-                reps=10, seconds_per_rep=5,
-                images=img("https://spotebi.com/wp-content/uploads/2015/05/romanian-deadlift-exercise-illustration.jpg"),
-            ),
-            exercise(
-                "Pallof press", 2,
-                description="De pie perpendicular al punto de anclaje. Extiende brazos al frente resistiendo la rotacion. Manten 2 segundos con brazos extendidos.",
-                icon="figure.core.training",
-                sets=3, rest_seconds=45, rest_after_seconds=60,
-                reps=10, seconds_per_rep=5,
-                images=img("9377-m-crop.png"),
-            ),
-            exercise(
-                "Face pull", 3,
-                description="Polea alta con cuerda. Tira hacia la cara con codos altos. Rota externamente los hombros separando la cuerda. Aprieta escapulas 2 segundos.",
-                icon="figure.strengthtraining.functional",
-                sets=4, rest_seconds=45, rest_after_seconds=60,
-                reps=15, seconds_per_rep=4,
-                images=img("2652-m-crop.png"),
-            ),
-            exercise(
-                "Pull-ups", 4,
-                description="Agarre prono. Inicia deprimiendo escapulas antes de doblar codos. Sube hasta que la barbilla pase la barra. Baja controlado 3 segundos.",
-                icon="figure.strengthtraining.functional",
-                sets=3, rest_seconds=90, rest_after_seconds=0,
-                reps=8, seconds_per_rep=6,
-                images=img("1157-m-crop.png"),
-            ),
-        ],
-    }
 
-    # ===================== FASE 2 DIA B =====================
-    fase2_b = {
-        "name": "Fase 2 - Dia B (Cadena anterior)",
-        "isDefault": False,
-        "intervalMinutes": 45,
-        "isActive": False,
-        "exercises": [
-            exercise(
-                "Sentadilla goblet", 0,
-                description="Mancuerna al pecho. Pies mas anchos que hombros. Baja controlando, rodillas hacia fuera. Sube empujando con talones.",
-                icon="figure.strengthtraining.functional",
-                sets=4, rest_seconds=60, rest_after_seconds=60,
-                reps=12, seconds_per_rep=5,
-                images=img("1735-m-crop.png"),
-            ),
-            exercise(
-                "Push-up con protraction", 1,
-                description="Flexion normal. Al llegar arriba, empuja EXTRA redondeando la espalda alta y separando omoplatos. Activa el serrato anterior.",
-                icon="figure.strengthtraining.functional",
-                sets=3, rest_seconds=60, rest_after_seconds=60,
-                reps=12, seconds_per_rep=4,
-                images=img("https://spotebi.com/wp-content/uploads/2014/10/push-up-exercise-illustration.jpg"),
-            ),
-            exercise(
-                "Remo con cable", 2,
-                description="Sentado en maquina de remo. Agarre neutro. Tira codos hacia atras juntando escapulas. Torso erguido. Excentrica 2-3 segundos.",
-                icon="figure.strengthtraining.functional",
-                sets=3, rest_seconds=60, rest_after_seconds=60,
-                reps=15, seconds_per_rep=4,
-                images=img("1729-m-crop.png"),
-            ),
-            exercise(
-                "Bird-dog", 3,
-                description="En cuadrupedia. Extiende un brazo al frente y pierna contraria hacia atras. Manten 3 segundos con espalda plana. Alterna.",
-                icon="figure.core.training",
-                sets=3, rest_seconds=30, rest_after_seconds=60,
-                reps=10, seconds_per_rep=6,
-                images=img("https://spotebi.com/wp-content/uploads/2014/10/bird-dogs-exercise-illustration.jpg"),
-            ),
-            exercise(
-                "Plancha lateral", 4,
-                duration_seconds=25,
-                description="Apoyado sobre antebrazo y lateral del pie. Cuerpo en linea recta. No dejes caer la cadera. Manten respirando normalmente.",
-                icon="figure.core.training",
-                sets=3, rest_seconds=30, rest_after_seconds=60,
-                images=img("https://spotebi.com/wp-content/uploads/2014/10/side-plank-exercise-illustration.jpg"),
-            ),
-            exercise(
-                "YTW en prono", 5,
-                description="Tumbado boca abajo. Forma Y (brazos al frente), T (brazos a los lados), W (codos flexionados con rotacion externa). Sin peso al principio.",
-                icon="figure.strengthtraining.functional",
-                sets=3, rest_seconds=45, rest_after_seconds=60,
-                reps=8, seconds_per_rep=5,
-                images=img("https://assets.caliverse.app/eyJidWNrZXQiOiJjYWxpc3RoZW5pY3MtaGFubmliYWwiLCJrZXkiOiJpbWFnZXNcL2V4ZXJjaXNlc1wvLTYxZjkxYTUyZWQwMmEucG5nIiwiZWRpdHMiOnsicmVzaXplIjp7IndpZHRoIjozNTAsImhlaWdodCI6MzUwLCJmaXQiOiJjb3ZlciJ9fX0="),
-            ),
-            exercise(
-                "Flexiones cervicales profundas", 6,
-                description="Tumbado boca arriba. Gesto suave de asentir con la barbilla hacia el pecho sin levantar la cabeza del suelo. Manten 10 segundos.",
-                icon="figure.cooldown",
-                sets=3, rest_seconds=15, rest_after_seconds=60,
-                reps=12, seconds_per_rep=10,
-                images=img("https://static1.squarespace.com/static/5f5e8592d2b0854b18af6975/5fb7c850d4788b5df8d8af32/5fb924738aa7f2271d70b581/1687452938720/Supine+Chin+Tuck.jpg?format=1500w"),
-            ),
-            exercise(
-                "Extension toracica con fitball", 7,
-                duration_seconds=38,
-                description="Siéntate delante del fitball. Apoya espalda alta sobre la pelota. Lleva brazos por encima de la cabeza y dejate caer hacia atras. Respira profundo.",
-                icon="figure.flexibility",
-                sets=3, rest_seconds=15, rest_after_seconds=0,
-                images=img("https://deporteyconsciencia.com/wp-content/uploads/2020/06/Estiramiento-con-fitball.jpg"),
-            ),
-        ],
-    }
+# Plan files use the keyword arguments of routine() and exercise() as keys
+ROUTINE_FIELDS = set(inspect.signature(routine).parameters)
+EXERCISE_FIELDS = set(inspect.signature(exercise).parameters)
+PLAN_FIELDS = {"output", "routines"}
+# The value type of each field; images are checked to be a list of strings
+ROUTINE_FIELD_TYPES = {"name": str, "exercises": list, "is_default": bool,
+                       "interval_minutes": int, "is_active": bool}
+EXERCISE_FIELD_TYPES = {"name": str, "sort_order": int, "duration_seconds": int,
+                        "description": str, "icon": str, "sets": int, "rest_seconds": int,
+                        "rest_after_seconds": int, "images": list, "reps": int,
+                        "seconds_per_rep": int}
+_TYPE_NAMES = {str: "a string", int: "an integer", bool: "true or false", list: "a list"}
 
-    # ===================== FASE 2 MOVILIDAD DIARIA =====================
-    fase2_mob = {
-        "name": "Fase 2 - Movilidad diaria",
-        "isDefault": False,
-        "intervalMinutes": 45,
-        "isActive": False,
-        "exercises": [
-            exercise(
-                "Foam roller toracico", 0,
-                duration_seconds=120,
-                description="Rodillo en zona toracica. Rueda lentamente. En puntos tensos, haz 3-4 extensiones.",
-                icon="figure.cooldown",
-                images=img("7753-m-crop.png"),
-                rest_after_seconds=10,
-            ),
-            exercise(
-                "Estiramiento flexores de cadera", 1,
-                duration_seconds=45,
-                description="Rodilla trasera en el suelo. Avanza cadera hacia delante apretando gluteo trasero. No arquees lumbar.",
-                icon="figure.flexibility",
-                rest_after_seconds=10,
-                images=img("https://spotebi.com/wp-content/uploads/2015/03/hip-flexor-stretch-exercise-illustration.jpg"),
-            ),
-            exercise(
-                "Estiramiento pectoral en puerta", 2,
-                duration_seconds=30,
-                description="Marco de puerta, antebrazos en laterales, codos a 90 grados. Avanza torso.",
-                icon="figure.flexibility",
-                rest_after_seconds=10,
-                images=img("https://spotebi.com/wp-content/uploads/2015/06/chest-stretch-exercise-illustration.jpg"),
-            ),
-            exercise(
-                "Chin tucks", 3,
-                description="De pie o sentado. Lleva barbilla hacia atras. Manten 5 segundos.",
-                icon="figure.cooldown",
-                reps=10, seconds_per_rep=5,
-                rest_after_seconds=10,
-                images=img("https://www.shutterstock.com/image-vector/chin-tuck-head-text-neck-600nw-2158119513.jpg"),
-            ),
-            exercise(
-                "Rotacion toracica", 4,
-                description="En cuadrupedia. Mano en la nuca. Rota abriendo el codo al techo. Alterna lados.",
-                icon="figure.flexibility",
-                reps=10, seconds_per_rep=5,
-                rest_after_seconds=0,
-            ),
-        ],
-    }
 
-    # ===================== FASE 3 DIA A =====================
-    fase3_a = {
-        "name": "Fase 3 - Dia A (Cadena posterior)",
-        "isDefault": False,
-        "intervalMinutes": 45,
-        "isActive": False,
-        "exercises": [
-            exercise(
-                "Peso muerto rumano con barra", 0,
-                description="Progresion a barra. Mismo patron de bisagra. Agarre prono o mixto. Baja hasta media espinilla. Espalda neutra.",
-                icon="figure.strengthtraining.functional",
-                sets=4, rest_seconds=90, rest_after_seconds=60,
-                reps=10, seconds_per_rep=5,
-                images=img("https://spotebi.com/wp-content/uploads/2015/05/romanian-deadlift-exercise-illustration.jpg"),
-            ),
-            exercise(
-                "Hip thrust con barra", 1,
-                description="Mas carga que Fase 2. Pausa de 2 segundos arriba. Objetivo: llegar a peso corporal en barra.",
-                icon="figure.strengthtraining.functional",
-                sets=4, rest_seconds=90, rest_after_seconds=60,
-                reps=10, seconds_per_rep=5,
-                images=img("6548-m-crop.png"),
-            ),
-            exercise(
-                "Pallof press rotacional", 2,
-                description="Mismo Pallof press pero al extender brazos anade rotacion controlada del torso alejandote del punto de anclaje.",
-                icon="figure.core.training",
-                sets=3, rest_seconds=45, rest_after_seconds=60,
-                reps=10, seconds_per_rep=5,
-                images=img("9377-m-crop.png"),
-            ),
-            exercise(
-                "Face pull + rotacion externa", 3,
-                description="Tira cuerda hacia la cara y rota punos hacia arriba hasta antebrazos verticales. Manten 2 segundos.",
-                icon="figure.strengthtraining.functional",
-                sets=3, rest_seconds=45, rest_after_seconds=60,
-                reps=15, seconds_per_rep=4,
-                images=img("2652-m-crop.png"),
-            ),
-            exercise(
-                "Plancha con transferencia de peso", 4,
-                duration_seconds=38,
-                description="Plancha frontal. Alterna levantando una mano (toca hombro contrario) sin que el cuerpo rote ni la cadera se hunda.",
-                icon="figure.core.training",
-                sets=3, rest_seconds=45, rest_after_seconds=60,
-                images=img("https://spotebi.com/wp-content/uploads/2016/03/plank-shoulder-tap-exercise-illustration-spotebi.jpg"),
-            ),
-            exercise(
-                "Pull-ups (progresion de volumen)", 5,
-                description="Misma tecnica con enfasis en depresion escapular y excentrica lenta. Objetivo: 4x10 limpias.",
-                icon="figure.strengthtraining.functional",
-                sets=4, rest_seconds=90, rest_after_seconds=0,
-                reps=10, seconds_per_rep=6,
-                images=img("1157-m-crop.png"),
-            ),
-        ],
-    }
+def _check_types(spec: dict, types: dict, where: str):
+    """Raise ValueError if a field of spec does not have its type in types."""
+    for field, value in spec.items():
+        expected = types[field]
+        # bool is a subclass of int, but true is not a number of seconds
+        if not isinstance(value, expected) or (isinstance(value, bool) and expected is not bool):
+            raise ValueError(f"{where}: {field} must be {_TYPE_NAMES[expected]}, got {value!r}")
 
-    # ===================== FASE 3 DIA B =====================
-    fase3_b = {
-        "name": "Fase 3 - Dia B (Cadena anterior)",
-        "isDefault": False,
-        "intervalMinutes": 45,
-        "isActive": False,
-        "exercises": [
-            exercise(
-                "Sentadilla goblet (pesada)", 0,
-                description="Misma tecnica con mas carga. Si la mancuerna se queda corta, pasa a front squat o anade pausa de 3 segundos abajo.",
-                icon="figure.strengthtraining.functional",
-                sets=4, rest_seconds=60, rest_after_seconds=60,
-                reps=12, seconds_per_rep=5,
-                images=img("1735-m-crop.png"),
-            ),
-            exercise(
-                "Push-up con protraction (pies elevados)", 1,
-                description="Push-up plus con pies en banco. Mantén protraccion escapular al final de cada rep.",
-                icon="figure.strengthtraining.functional",
-                sets=3, rest_seconds=60, rest_after_seconds=60,
-                reps=15, seconds_per_rep=4,
-                images=img("https://spotebi.com/wp-content/uploads/2014/10/push-up-exercise-illustration.jpg"),
-            ),
-            exercise(
-                "Remo invertido (TRX o barra baja)", 2,
-                description="Cuelga de barra baja o TRX. Tira pecho hacia barra apretando escapulas al final. Baja controlado.",
-                icon="figure.strengthtraining.functional",
-                sets=3, rest_seconds=60, rest_after_seconds=60,
-                reps=12, seconds_per_rep=5,
-                images=img("1441-m-crop.png"),
-            ),
-            exercise(
-                "Movilidad toracica con rotacion", 3,
-                description="En cuadrupedia. Mano en la nuca. Rota torso llevando codo al techo. Vuelve pasando codo por debajo del cuerpo.",
-                icon="figure.flexibility",
-                sets=2, rest_seconds=15, rest_after_seconds=30,
-                reps=10, seconds_per_rep=5,
-                images=img("https://spotebi.com/wp-content/uploads/2017/11/thread-the-needle-pose-parsva-balasana-spotebi.jpg"),
-            ),
-            exercise(
-                "Estiramiento dinamico flexores de cadera", 4,
-                description="Zancada larga hacia delante. En posicion baja, levanta brazo del lado de pierna trasera al techo. Alterna.",
-                icon="figure.flexibility",
-                sets=2, rest_seconds=15, rest_after_seconds=0,
-                reps=10, seconds_per_rep=5,
-                images=img("https://spotebi.com/wp-content/uploads/2015/03/hip-flexor-stretch-exercise-illustration.jpg"),
-            ),
-        ],
-    }
 
-    # ===================== FASE 3 MOVILIDAD DIARIA =====================
-    fase3_mob = {
-        "name": "Fase 3 - Movilidad diaria",
-        "isDefault": False,
-        "intervalMinutes": 45,
-        "isActive": False,
-        "exercises": [
-            exercise(
-                "Foam roller toracico", 0,
-                duration_seconds=120,
-                description="Rodillo en zona toracica. Rueda lentamente arriba y abajo.",
-                icon="figure.cooldown",
-                images=img("7753-m-crop.png"),
-                rest_after_seconds=10,
-            ),
-            exercise(
-                "Estiramiento flexores de cadera", 1,
-                duration_seconds=30,
-                description="Rodilla trasera en el suelo. Avanza cadera apretando gluteo.",
-                icon="figure.flexibility",
-                rest_after_seconds=10,
-                images=img("https://spotebi.com/wp-content/uploads/2015/03/hip-flexor-stretch-exercise-illustration.jpg"),
-            ),
-            exercise(
-                "Chin tucks", 2,
-                description="Lleva barbilla hacia atras. Manten 5 segundos.",
-                icon="figure.cooldown",
-                reps=10, seconds_per_rep=5,
-                rest_after_seconds=10,
-                images=img("https://www.shutterstock.com/image-vector/chin-tuck-head-text-neck-600nw-2158119513.jpg"),
-            ),
-            exercise(
-                "Rotacion toracica", 3,
-                description="En cuadrupedia. Mano en la nuca. Rota codo al techo. Alterna.",
-                icon="figure.flexibility",
-                reps=10, seconds_per_rep=5,
-                rest_after_seconds=10,
-            ),
-            exercise(
-                "Respiracion diafragmatica", 4,
-                duration_seconds=180,
-                description="Tumbado boca arriba. Mano en abdomen. Solo se mueve el abdomen. Inspira 4 segundos, espira 6 segundos.",
-                icon="figure.cooldown",
-                rest_after_seconds=0,
-            ),
-        ],
-    }
+def load_plan(path: str) -> dict:
+    """Read and check a plan file (.json, .toml, or .yaml/.yml).
 
-    return {
-        "routines": [fase1, fase2_a, fase2_b, fase2_mob, fase3_a, fase3_b, fase3_mob]
+    A plan is {"output": optional file name, "routines": [...]}; each routine
+    and exercise is written with the keyword arguments of routine() and
+    exercise(). An exercise's sort_order defaults to its position and its
+    images are a list of URLs or LOCAL_IMG_DIR file names.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            sys.exit("TOML plans require Python 3.11 or later")
+        with open(path, "rb") as f:
+            try:
+                plan = tomllib.load(f)
+            except tomllib.TOMLDecodeError as e:
+                raise ValueError(f"{path}: {e}") from e
+    elif ext in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            sys.exit("YAML plans require PyYAML (pip install PyYAML)")
+        with open(path, encoding="utf-8") as f:
+            try:
+                plan = yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise ValueError(f"{path}: {e}") from e
+    elif ext == ".json":
+        with open(path, encoding="utf-8") as f:
+            try:
+                plan = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}: {e}") from e
+    else:
+        raise ValueError(f"{path}: unknown plan format {ext!r}")
+
+    if not isinstance(plan, dict) or not isinstance(plan.get("routines"), list):
+        raise ValueError(f"{path}: a plan needs a list of routines")
+    unknown = set(plan) - PLAN_FIELDS
+    if unknown:
+        raise ValueError(f"{path}: unknown plan field(s) {', '.join(sorted(unknown))}")
+    if not isinstance(plan.get("output", ""), str):
+        raise ValueError(f"{path}: output must be a file name, got {plan['output']!r}")
+    for r, routine_spec in enumerate(plan["routines"]):
+        where = f"{path}: routine {r + 1}"
+        if not isinstance(routine_spec, dict):
+            raise ValueError(f"{where}: a routine must be a table of fields")
+        unknown = set(routine_spec) - ROUTINE_FIELDS
+        if unknown:
+            raise ValueError(f"{where}: unknown field(s) {', '.join(sorted(unknown))}")
+        if "name" not in routine_spec or not isinstance(routine_spec.get("exercises"), list):
+            raise ValueError(f"{where}: a routine needs a name and a list of exercises")
+        _check_types(routine_spec, ROUTINE_FIELD_TYPES, where)
+        for e, spec in enumerate(routine_spec["exercises"]):
+            ex_where = f"{where}, exercise {e + 1}"
+            if not isinstance(spec, dict):
+                raise ValueError(f"{ex_where}: an exercise must be a table of fields")
+            unknown = set(spec) - EXERCISE_FIELDS
+            if unknown:
+                raise ValueError(f"{ex_where}: unknown field(s) {', '.join(sorted(unknown))}")
+            if "name" not in spec:
+                raise ValueError(f"{ex_where}: an exercise needs a name")
+            _check_types(spec, EXERCISE_FIELD_TYPES, ex_where)
+            if not all(isinstance(source, str) for source in spec.get("images", [])):
+                raise ValueError(f"{ex_where}: images must be a list of URLs or file names, "
+                                 f"got {spec['images']!r}")
+    return plan
+
+
+def plan_sources(plan: dict) -> list:
+    """Return every image source a plan references, in order."""
+    return [
+        source
+        for routine_spec in plan["routines"]
+        for spec in routine_spec["exercises"]
+        for source in spec.get("images", [])
+    ]
+
+
+def build_routines(plan: dict = None):
+    """Build the RoutineFile data for plan (default: DEFAULT_PLAN)."""
+    if plan is None:
+        plan = load_plan(DEFAULT_PLAN)
+    routines = []
+    for routine_spec in plan["routines"]:
+        exercises = []
+        for position, spec in enumerate(routine_spec["exercises"]):
+            spec = {"sort_order": position, **spec}
+            spec["images"] = [ref for source in spec.get("images", []) for ref in img(source)]
+            exercises.append(exercise(**spec))
+        routines.append(routine(**{**routine_spec, "exercises": exercises}))
+    return {"routines": routines}
+
+
+# Phase names match ExercisePhase in ExerciseSessionService.swift
+TIMELINE_PHASES = ("exercise", "restBetweenSets", "restAfterExercise")
+
+
+def effective_duration(ex) -> int:
+    """Seconds one set takes, as Exercise.effectiveDurationSeconds computes it."""
+    if ex.get("reps"):
+        return ex["reps"] * (ex.get("secondsPerRep") or 5)
+    return ex["durationSeconds"]
+
+
+def compile_timeline(exercises: list):
+    """Flatten a routine into the phase segments a session plays, in order.
+
+    Each segment is {"exercise": index into exercises, "set", "phase",
+    "offset", "duration"}, with times in seconds from the session start.
+    Zero-length rests are left out. Returns (segments, index) where index
+    holds the total (as Routine.totalDurationSeconds computes it), active
+    and rest seconds, plus the start offset of each exercise by index.
+    """
+    segments = []
+    offsets = [0] * len(exercises)
+    offset = active = rest = 0
+
+    def add(index, set_number, phase, duration):
+        nonlocal offset
+        segments.append({"exercise": index, "set": set_number, "phase": phase,
+                         "offset": offset, "duration": duration})
+        offset += duration
+
+    order = sorted(range(len(exercises)), key=lambda i: exercises[i]["sortOrder"])
+    for index in order:
+        ex = exercises[index]
+        offsets[index] = offset
+        duration = effective_duration(ex)
+        for set_number in range(1, ex["sets"] + 1):
+            add(index, set_number, "exercise", duration)
+            active += duration
+            if set_number < ex["sets"] and ex["restSeconds"] > 0:
+                add(index, set_number, "restBetweenSets", ex["restSeconds"])
+                rest += ex["restSeconds"]
+        if ex["restAfterSeconds"] > 0:
+            add(index, ex["sets"], "restAfterExercise", ex["restAfterSeconds"])
+            rest += ex["restAfterSeconds"]
+
+    index = {
+        "totalSeconds": offset,
+        "activeSeconds": active,
+        "restSeconds": rest,
+        "exerciseOffsets": offsets,
     }
+    return segments, index
+
+
+def add_timelines(data):
+    """Return a copy of data where every routine carries "timelineIndex" and "timeline".
+
+    Both go before "exercises", so a streaming reader reaches them without
+    passing any image data. Readers that do not know the fields ignore them.
+    """
+    routines = []
+    for routine_data in data["routines"]:
+        segments, index = compile_timeline(routine_data["exercises"])
+        entry = {}
+        for key, value in routine_data.items():
+            if key == "exercises":
+                entry["timelineIndex"] = index
+                entry["timeline"] = segments
+            entry[key] = value
+        routines.append(entry)
+    return {**data, "routines": routines}
 
 
 def clean_nulls(obj):
@@ -507,27 +1532,978 @@ def clean_nulls(obj):
     return obj
 
 
-def main():
-    data = build_routines()
-    data = clean_nulls(data)
+def tabulate_images(data):
+    """Move images into a top-level table keyed by digest.
+
+    Each exercise's "images" becomes "imageRefs", a list of digests into
+    "imageTable", and its "imageVariants" lists hold digests too. Every
+    distinct image appears, and is encoded, exactly once.
+    """
+    table = {}
+    routines = []
+    for routine in data["routines"]:
+        exercises = []
+        for ex in routine["exercises"]:
+            entry = {}
+            for key, value in ex.items():
+                if key == "images":
+                    for ref in value:
+                        table.setdefault(ref.digest, ref)
+                    entry["imageRefs"] = [ref.digest for ref in value]
+                elif key == "imageVariants":
+                    for refs in value.values():
+                        for ref in refs:
+                            table.setdefault(ref.digest, ref)
+                    entry[key] = {name: [ref.digest for ref in refs] for name, refs in value.items()}
+                else:
+                    entry[key] = value
+            exercises.append(entry)
+        routines.append({**routine, "exercises": exercises})
+    return {**data, "routines": routines, "imageTable": table}
+
+
+def _json_default(obj):
+    if isinstance(obj, ImageRef):
+        return obj.b64
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class JSONLayout:
+    """How an output file is laid out, whichever writer or backend encodes it.
+
+    Every layout is indented by two spaces, keeps non-ASCII text as UTF-8
+    and drops None values. The app layout also sorts keys, writes " : "
+    after each key, escapes "/" as "\\/" and opens empty lists and dicts
+    over an empty line, as the app's JSONEncoder does.
+    """
+
+    def __init__(self, name: str, sort_keys: bool = False, key_separator: str = ": ",
+                 escape_slashes: bool = False, open_empty: bool = False):
+        self.name = name
+        self.sort_keys = sort_keys
+        self.key_separator = key_separator
+        self.escape_slashes = escape_slashes
+        self.open_empty = open_empty
+
+    def scalar(self, value) -> str:
+        text = json.dumps(value, ensure_ascii=False)
+        return text.replace("/", "\\/") if self.escape_slashes else text
+
+    def empty(self, brackets: str, newline: str) -> str:
+        """An empty list or dict ("[]" or "{}") whose closing line starts with newline."""
+        return brackets[0] + "\n" + newline + brackets[1] if self.open_empty else brackets
+
+    def finish(self, text: bytes) -> bytes:
+        """Lay out UTF-8 json.dumps(indent=2, sort_keys=self.sort_keys) output."""
+        if self.key_separator != ": " or self.open_empty:
+            text = b"\n".join(self._relayout_lines(text.split(b"\n")))
+        return text.replace(b"/", b"\\/") if self.escape_slashes else text
+
+    def _relayout_lines(self, lines):
+        # A JSON string never spans lines and escapes every quote in it, so a
+        # key can only open a line and ends at the first unescaped '": ', and
+        # a line ending in [] or {} (and a comma) ends in an empty container
+        separator = self.key_separator.encode()
+        for line in lines:
+            indent = len(line) - len(line.lstrip(b" "))
+            if separator != b": " and line.startswith(b'"', indent):
+                end = line.find(b'": ', indent + 1)
+                while end != -1 and (end - len(line[:end].rstrip(b"\\"))) % 2:
+                    end = line.find(b'": ', end + 1)
+                if end != -1:
+                    line = line[:end + 1] + separator + line[end + 3:]
+            if self.open_empty and line.endswith((b"[]", b"{}", b"[],", b"{},")):
+                close = -2 if line.endswith(b",") else -1
+                yield line[:close]
+                yield b""
+                line = line[:indent] + line[close:]
+            yield line
+
+
+JSON_LAYOUTS = {
+    # json.dump(indent=2, ensure_ascii=False): what the generator has always written
+    "python": JSONLayout("python"),
+    # JSONEncoder [.prettyPrinted, .sortedKeys], as the app's exportRoutines writes
+    "app": JSONLayout("app", sort_keys=True, key_separator=" : ", escape_slashes=True,
+                      open_empty=True),
+}
+
+
+def _stdlib_dumps(obj, sort_keys: bool, default) -> bytes:
+    return json.dumps(obj, indent=2, ensure_ascii=False, sort_keys=sort_keys,
+                      default=default).encode()
+
+
+def _orjson_safe(obj) -> bool:
+    """Whether orjson writes every float in obj the way json.dumps does."""
+    if isinstance(obj, float):
+        # Outside this range both write an exponent, but orjson omits the
+        # "+" json.dumps puts in 1e+16
+        return obj == 0 or 1e-4 <= abs(obj) < 1e16
+    if isinstance(obj, dict):
+        return all(_orjson_safe(v) for v in obj.values())
+    if isinstance(obj, list):
+        return all(_orjson_safe(v) for v in obj)
+    return True
+
+
+def _orjson_dumps(obj, sort_keys: bool, default) -> bytes:
+    import orjson
+
+    # orjson writes tiny and huge floats and NaN differently and rejects ints beyond
+    # 64 bits; such documents go to the stdlib so the bytes never depend on
+    # the backend
+    if not _orjson_safe(obj):
+        return _stdlib_dumps(obj, sort_keys, default)
+    option = orjson.OPT_INDENT_2 | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+    try:
+        return orjson.dumps(obj, default=default, option=option)
+    except orjson.JSONEncodeError:
+        return _stdlib_dumps(obj, sort_keys, default)
+
+
+# Encoders for the buffered writer; all of them produce identical bytes
+JSON_BACKENDS = {"stdlib": _stdlib_dumps, "orjson": _orjson_dumps}
+
+
+def json_backend(name: str = "auto") -> str:
+    """Resolve a --json-backend choice; "auto" picks orjson when it is installed."""
+    if name == "auto":
+        return "orjson" if importlib.util.find_spec("orjson") else "stdlib"
+    if name == "orjson" and importlib.util.find_spec("orjson") is None:
+        raise ValueError("orjson is not installed (pip install orjson)")
+    return name
+
+
+def dumps_json(obj, layout: JSONLayout = None, backend: str = "stdlib") -> bytes:
+    """Encode obj, already free of None values, as UTF-8 in layout with backend.
+
+    The backend encodes each image as a short placeholder, and the Base64 is
+    spliced in afterwards, once per distinct image: the backend and the
+    layout pass only ever see the small remainder of the document.
+    """
+    layout = layout or JSON_LAYOUTS["python"]
+    encode = JSON_BACKENDS[backend]
+    marker = f"@{os.urandom(8).hex()}:"
+    refs = []
+
+    def placeholder(value):
+        if not isinstance(value, ImageRef):
+            return _json_default(value)
+        refs.append(value)
+        return f"{marker}{len(refs) - 1}"
+
+    pieces = layout.finish(encode(obj, layout.sort_keys, placeholder)).split(marker.encode())
+    if len(pieces) != len(refs) + 1:
+        # The document itself contains the marker text; encode it whole
+        return layout.finish(encode(obj, layout.sort_keys, _json_default))
+    encoded = {}
+    out = [pieces[0]]
+    for piece in pieces[1:]:
+        index, rest = piece.split(b'"', 1)
+        ref = refs[int(index)]
+        if ref.digest not in encoded:
+            b64 = ref.b64.encode("ascii")
+            encoded[ref.digest] = b64.replace(b"/", b"\\/") if layout.escape_slashes else b64
+        out += (encoded[ref.digest], b'"', rest)
+    return b"".join(out)
+
+
+class _Tee:
+    def __init__(self, *files):
+        self.files = files
+
+    def write(self, text):
+        for f in self.files:
+            f.write(text)
+
+
+class BuildCache:
+    """Serialized routine fragments from earlier runs.
+
+    Each fragment is the exact text a routine occupies in the output, stored
+    under a fingerprint of everything that text depends on: the routine's
+    fields, the digests of its images and the indentation it is written at.
+    An unchanged routine is copied from its fragment instead of being
+    serialized and Base64-encoded again, so the output stays byte-identical
+    to a full rebuild.
+    """
+
+    FRAGMENT_VERSION = 1
+
+    def __init__(self, root: str, reuse: bool = True):
+        self.root = root
+        self.reuse = reuse
+        self.fragments_dir = os.path.join(root, "fragments")
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                self.manifest = json.load(f).get("fragments", {})
+        self.used = {}
+        self.reused = 0
+
+    def fingerprint(self, routine, newline: str, layout: JSONLayout) -> str:
+        key = json.dumps(
+            [self.FRAGMENT_VERSION, layout.name, newline, routine],
+            ensure_ascii=False, default=lambda ref: ref.digest,
+        )
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def write_routine(self, routine, f, newline: str, layout: JSONLayout):
+        fp = self.fingerprint(routine, newline, layout)
+        path = os.path.join(self.fragments_dir, fp)
+        self.used[fp] = {"name": routine.get("name")}
+        if self.reuse and fp in self.manifest and os.path.exists(path):
+            with open(path, encoding="utf-8") as cached:
+                shutil.copyfileobj(cached, f)
+            self.reused += 1
+            return
+
+        os.makedirs(self.fragments_dir, exist_ok=True)
+        tmp_path = _temp_path(path)
+        with open(tmp_path, "w", encoding="utf-8") as fragment:
+            _write_value(routine, _Tee(f, fragment), newline, layout)
+        os.replace(tmp_path, path)
+
+    def save(self):
+        """Record this run's fragments and drop the ones it did not use."""
+        for fp in set(self.manifest) - set(self.used):
+            try:
+                os.remove(os.path.join(self.fragments_dir, fp))
+            except FileNotFoundError:
+                pass
+        _save_json_atomic(self.manifest_path,
+                          {"version": self.FRAGMENT_VERSION, "fragments": self.used},
+                          ensure_ascii=False)
+        self.manifest = self.used
+
+
+def write_json(data, f, build_cache: BuildCache = None, layout: JSONLayout = None):
+    """Write data the way dumps_json(clean_nulls(data), layout) would.
+
+    Builds no intermediate copies: None values are skipped on the fly and
+    images are Base64-encoded chunk by chunk straight into f, so peak memory
+    stays near one chunk rather than the size of the output. With a
+    build_cache, unchanged routines are copied from earlier runs.
+    """
+    _write_value(data, f, "\n", layout or JSON_LAYOUTS["python"], build_cache)
+
+
+def _write_value(obj, f, newline, layout, build_cache=None):
+    if isinstance(obj, ImageRef):
+        f.write('"')
+        for chunk in obj.iter_b64():
+            f.write(chunk.replace("/", "\\/") if layout.escape_slashes else chunk)
+        f.write('"')
+    elif isinstance(obj, dict):
+        items = [(k, v) for k, v in obj.items() if v is not None]
+        if layout.sort_keys:
+            items.sort(key=lambda item: item[0])
+        if not items:
+            f.write(layout.empty("{}", newline))
+            return
+        inner = newline + "  "
+        sep = "{" + inner
+        for key, value in items:
+            f.write(sep)
+            f.write(layout.scalar(key))
+            f.write(layout.key_separator)
+            if key == "routines" and build_cache is not None:
+                _write_routines(value, f, inner, layout, build_cache)
+            else:
+                _write_value(value, f, inner, layout)
+            sep = "," + inner
+        f.write(newline + "}")
+    elif isinstance(obj, list):
+        if not obj:
+            f.write(layout.empty("[]", newline))
+            return
+        inner = newline + "  "
+        sep = "[" + inner
+        for item in obj:
+            f.write(sep)
+            _write_value(item, f, inner, layout)
+            sep = "," + inner
+        f.write(newline + "]")
+    else:
+        f.write(layout.scalar(obj))
+
+
+def _write_routines(routines, f, newline, layout, build_cache):
+    if not routines:
+        f.write(layout.empty("[]", newline))
+        return
+    inner = newline + "  "
+    sep = "[" + inner
+    for routine in routines:
+        f.write(sep)
+        build_cache.write_routine(routine, f, inner, layout)
+        sep = "," + inner
+    f.write(newline + "]")
+
+
+# Bundle layout: a JSON manifest with the RoutineFile shape whose exercise
+# "images" hold member names, followed by the raw images stored uncompressed.
+BUNDLE_MANIFEST = "routines.json"
+BUNDLE_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+_MIME_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif",
+                    "image/webp": ".webp"}
+
+
+class BundleImage(ImageRef):
+    """An image stored as a member of a routine bundle."""
+
+    __slots__ = ("bundle", "member")
+
+    def __init__(self, bundle: zipfile.ZipFile, member: str):
+        self.bundle = bundle
+        self.member = member
+        self.path = None
+        self.size = bundle.getinfo(member).file_size
+        self.digest = os.path.splitext(os.path.basename(member))[0]
+        self._b64 = None
+
+    def open(self):
+        return self.bundle.open(self.member)
+
+
+def bundle_member(ref: ImageRef) -> str:
+    with ref.open() as f:
+        head = f.read(16)
+    return f"images/{ref.digest}{_MIME_EXTENSIONS.get(sniff_mime(head), '')}"
+
+
+def write_bundle(data, path: str, layout: JSONLayout = None):
+    """Write data as a zip bundle of a JSON manifest plus raw image members.
+
+    Images are stored once each, uncompressed, so readers can slice or
+    memory-map them straight out of the file (see bundle_member_span).
+    """
+    members = {digest: bundle_member(ref) for digest, ref in distinct_images(data).items()}
+    manifest = map_images(data, lambda ref: members[ref.digest])
+
+    with zipfile.ZipFile(path, "w") as zf:
+        info = zipfile.ZipInfo(BUNDLE_MANIFEST, BUNDLE_DATE_TIME)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with zf.open(info, "w") as raw, io.TextIOWrapper(raw, encoding="utf-8") as f:
+            write_json(manifest, f, layout=layout)
+        for digest, ref in distinct_images(data).items():
+            info = zipfile.ZipInfo(members[digest], BUNDLE_DATE_TIME)
+            info.compress_type = zipfile.ZIP_STORED
+            with ref.open() as src, zf.open(info, "w") as dst:
+                shutil.copyfileobj(src, dst)
+
 
-    with open(OUTPUT_PATH, "w") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def read_bundle(path: str):
+    """Open a bundle and return (data, zipfile) with BundleImage references.
 
-    # Print summary
-    total_exercises = sum(len(r["exercises"]) for r in data["routines"])
-    total_images = sum(
-        len(e.get("images", []))
-        for r in data["routines"]
-        for e in r["exercises"]
+    The zipfile must stay open while the images are read.
+    """
+    zf = zipfile.ZipFile(path)
+    with zf.open(BUNDLE_MANIFEST) as f:
+        data = json.load(f)
+    return map_images(data, lambda member: BundleImage(zf, member)), zf
+
+
+def bundle_member_span(zf: zipfile.ZipFile, member: str):
+    """Return (offset, size) of a stored member's bytes within the bundle file."""
+    info = zf.getinfo(member)
+    if info.compress_type != zipfile.ZIP_STORED:
+        raise ValueError(f"{member} is compressed")
+    zf.fp.seek(info.header_offset)
+    header = zf.fp.read(30)
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    return info.header_offset + 30 + name_len + extra_len, info.file_size
+
+
+COMPRESSED_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def _open_compressed(f, name: str, codec: str, level: int):
+    """A compressing writer on top of f, an open binary file that stays open.
+
+    name is the final file name; gzip records it in its header without .gz.
+    """
+    if codec == "gzip":
+        return gzip.GzipFile(filename=name, mode="wb", compresslevel=level, fileobj=f, mtime=0)
+    import zstandard
+    return zstandard.ZstdCompressor(level=level).stream_writer(f, closefd=False)
+
+
+def compress_file(path: str, codec: str, level: int):
+    """Stream path through codec into path + extension. Returns (path, seconds)."""
+    out_path = path + COMPRESSED_EXTENSIONS[codec]
+    tmp_path = out_path + ".tmp"
+    start = time.perf_counter()
+    try:
+        with open(path, "rb") as src, open(tmp_path, "wb") as f:
+            with _open_compressed(f, os.path.basename(out_path), codec, level) as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return out_path, time.perf_counter() - start
+
+
+# Levels each codec accepts, for --gzip-level and --zstd-level
+COMPRESSION_LEVELS = {"gzip": (0, 9), "zstd": (1, 22)}
+
+
+def _level(codec: str):
+    low, high = COMPRESSION_LEVELS[codec]
+
+    def parse(text: str) -> int:
+        if not text.isdigit() or not low <= int(text) <= high:
+            raise argparse.ArgumentTypeError(f"expected {low}-{high}, got {text!r}")
+        return int(text)
+
+    return parse
+
+
+def _variant(text: str):
+    name, sep, size = text.partition("=")
+    if not sep or not name or not size.isdigit() or int(size) <= 0:
+        raise argparse.ArgumentTypeError(f"expected NAME=SIZE, got {text!r}")
+    return name, int(size)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate postural_routines.json")
+    parser.add_argument(
+        "--plan", action="append", default=[],
+        help="plan file to compile (repeatable; default: plans/postural.json)",
+    )
+    parser.add_argument(
+        "--format", choices=("json", "bundle"), default="json",
+        help="inline-Base64 JSON (default) or a zip of a JSON manifest plus raw images",
+    )
+    parser.add_argument(
+        "-o", "--output",
+        help="output path when compiling a single plan (default: the plan's output "
+             "name in --out-dir, with .zip for bundles)",
+    )
+    parser.add_argument(
+        "--out-dir", default=OUTPUT_DIR,
+        help="directory for plan outputs (default: next to this script)",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=os.cpu_count(),
+        help="worker processes when compiling several plans (default: CPU count)",
+    )
+    parser.add_argument(
+        "--compress", action="append", choices=sorted(COMPRESSED_EXTENSIONS), default=[],
+        help="also write a compressed copy of the output (repeatable; zstd needs zstandard)",
+    )
+    parser.add_argument(
+        "--gzip-level", type=_level("gzip"), default=6,
+        help="gzip compression level for --compress gzip, 0-9 (default: 6)",
+    )
+    parser.add_argument(
+        "--zstd-level", type=_level("zstd"), default=3,
+        help="zstd compression level for --compress zstd, 1-22 (default: 3)",
+    )
+    parser.add_argument(
+        "--images", choices=("inline", "table"), default="inline",
+        help="embed images per exercise (default) or once in a top-level table",
+    )
+    parser.add_argument(
+        "--writer", choices=("stream", "buffered"), default="stream",
+        help="stream the output (default) or build it in memory and encode it in one call",
+    )
+    parser.add_argument(
+        "--json-backend", choices=("auto", *JSON_BACKENDS), default="auto",
+        help="encoder for --writer buffered; auto uses orjson when it is installed "
+             "(default: auto). Every backend writes identical bytes",
+    )
+    parser.add_argument(
+        "--json-layout", choices=tuple(JSON_LAYOUTS), default="python",
+        help="python: json.dump(indent=2) (default); app: sorted keys and the spacing "
+             "and escaping of the app's export, so the two files diff cleanly",
+    )
+    parser.add_argument(
+        "--full-rebuild", action="store_true",
+        help="serialize every routine again instead of reusing unchanged ones",
+    )
+    parser.add_argument(
+        "--normalize", action="store_true",
+        help="downscale and re-encode images before embedding (requires Pillow)",
+    )
+    parser.add_argument(
+        "--max-size", type=int, default=720,
+        help="longest side in pixels for --normalize (default: 720)",
+    )
+    parser.add_argument(
+        "--image-format", choices=sorted(NORMALIZED_FORMATS), default="jpeg",
+        help="output format for --normalize (default: jpeg)",
+    )
+    parser.add_argument(
+        "--quality", type=int, default=80,
+        help="JPEG/WebP quality for --normalize (default: 80)",
+    )
+    parser.add_argument(
+        "--variant", action="append", type=_variant, default=[], metavar="NAME=SIZE",
+        help="also embed each image downscaled to SIZE px under imageVariants[NAME], "
+             "e.g. thumb=160 (repeatable; requires Pillow)",
+    )
+    parser.add_argument(
+        "--timeline", action="store_true",
+        help="add each routine's precompiled session timeline and duration index",
+    )
+    parser.add_argument(
+        "--similar", action="store_true",
+        help="report clusters of near-duplicate images (requires NumPy and Pillow)",
+    )
+    parser.add_argument(
+        "--collapse-similar", action="store_true",
+        help="embed one canonical image (the largest) for each near-duplicate cluster",
+    )
+    parser.add_argument(
+        "--similar-distance", type=int, default=SIMILAR_DISTANCE,
+        help="maximum dHash bit difference for images to count as similar, inclusive "
+             f"(default: {SIMILAR_DISTANCE}; distinct drawings can be 4 bits apart)",
+    )
+    parser.add_argument(
+        "--revalidate", action="store_true",
+        help="check cached images against their servers with conditional requests",
+    )
+    parser.add_argument(
+        "--watch", action="store_true",
+        help="after building, rebuild whenever a plan, local image or the image cache changes",
+    )
+    parser.add_argument(
+        "--debounce", type=float, default=0.3,
+        help="seconds without further changes before a --watch rebuild (default: 0.3)",
+    )
+    parser.add_argument(
+        "--stats", action="store_true",
+        help="print per-phase timings, byte counts and cache counters",
+    )
+    parser.add_argument(
+        "--stats-json", metavar="PATH",
+        help="write the --stats report as JSON to PATH (implies --stats collection)",
+    )
+    parser.add_argument(
+        "--cache-max-mb", type=float, default=512,
+        help="evict least recently used cached images above this size; 0 for no limit "
+             "(default: 512)",
+    )
+    parser.add_argument(
+        "--prune-cache", action="store_true",
+        help="drop cached images that none of the compiled plans use",
+    )
+    parser.add_argument(
+        "--check-cache", action="store_true",
+        help="verify every cached image and download bad ones again",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=8,
+        help="concurrent downloads for uncached images, and threads hashing "
+             "local images (default: 8)",
+    )
+    parser.add_argument(
+        "--per-host", type=int, default=4,
+        help="maximum concurrent connections per host (default: 4)",
     )
-    file_size = os.path.getsize(OUTPUT_PATH)
+    parser.add_argument(
+        "--timeout", type=float, default=15,
+        help="seconds before a single download attempt gives up (default: 15)",
+    )
+    parser.add_argument(
+        "--retries", type=int, default=3,
+        help="retries with exponential backoff for transient download failures (default: 3)",
+    )
+    parser.add_argument(
+        "--fetch-budget", type=float, metavar="SECONDS",
+        help="total time allowed for downloading; later downloads count as failed",
+    )
+    args = parser.parse_args(argv)
+    args.variant = dict(args.variant)
+    return args
+
+
+def find_similar(refs: dict, sources, max_distance: int, report: bool = True) -> dict:
+    """Cluster near-duplicate images; return {digest: canonical ImageRef} for the non-canonical ones."""
+    if importlib.util.find_spec("numpy") is None or importlib.util.find_spec("PIL") is None:
+        sys.exit("Similarity detection requires NumPy and Pillow (pip install numpy Pillow)")
+    start = time.perf_counter()
+    index = PerceptualIndex(os.path.join(CACHE_DIR, "phash.json"))
+    index.update(refs)
+    index.save()
+    clusters = index.clusters(refs, max_distance)
+    _record("phash", start)
+
+    canonical = {}
+    for cluster in clusters:
+        for digest in cluster[1:]:
+            canonical[digest] = refs[cluster[0]]
+    if report:
+        names = {}
+        for source in sources:
+            ref = _images_by_source.get(source)
+            if ref:
+                names.setdefault(ref.digest, []).append(source)
+        print(f"Similar images: {len(clusters)} cluster(s) within {max_distance} bit(s), "
+              f"{len(canonical)} image(s) could be dropped")
+        for cluster in clusters:
+            best = int(index.hashes[cluster[0]]["dhash"], 16)
+            for n, digest in enumerate(cluster):
+                distance = bin(int(index.hashes[digest]["dhash"], 16) ^ best).count("1")
+                label = "keep" if n == 0 else f"{distance:>2} bit"
+                for source in names.get(digest, [digest]):
+                    print(f"  {label:<6} {refs[digest].size / 1024:>7.1f} KB  {source[:90]}")
+            print()
+    return canonical
+
+
+def plan_output_path(plan_path: str, plan: dict, fmt: str, out_dir: str) -> str:
+    name = plan.get("output") or os.path.splitext(os.path.basename(plan_path))[0] + ".json"
+    if fmt == "bundle":
+        name = os.path.splitext(name)[0] + ".zip"
+    return os.path.join(out_dir, name)
+
+
+def compile_plan(plan: dict, output_path: str, args, normalized: dict = None,
+                 variants: dict = None, canonical: dict = None) -> dict:
+    """Build one plan and write it, plus any compressed copies. Returns a summary.
+
+    The plan's images must already be loaded (main does this once for all
+    plans); canonical maps digests of near-duplicates to the image that
+    replaces them, normalized maps digests to normalized ImageRefs, and
+    variants maps variant names to {digest: ImageRef} for the images as
+    embedded (see add_image_variants).
+    """
+    start = time.perf_counter()
+    data = build_routines(plan)
+    _record("build_routines", start)
+    if args.timeline:
+        data = add_timelines(data)
+    if canonical:
+        data = collapse_images(data, canonical)
+    if normalized is not None:
+        data = map_images(data, lambda ref: normalized[ref.digest])
+    if variants:
+        data = add_image_variants(data, variants)
+    summary = {
+        "output": output_path,
+        "routines": len(data["routines"]),
+        "exercises": sum(len(r["exercises"]) for r in data["routines"]),
+        "images": sum(len(e.get("images", [])) for r in data["routines"] for e in r["exercises"]),
+        "distinctImages": len(distinct_images(data)),
+        "reused": None,
+        "compressed": [],
+    }
+
+    # Written under a temporary name and renamed, so readers never see a partial file
+    tmp_path = output_path + ".tmp"
+    layout = JSON_LAYOUTS[args.json_layout]
+    encode_start = write_start = time.perf_counter()
+    if args.format == "bundle":
+        writer = "write_bundle"
+        write_bundle(data, tmp_path, layout)
+    else:
+        if args.images == "table":
+            data = tabulate_images(data)
+        if args.writer == "stream":
+            writer = "write_json"
+            # One cache per output, so plans never prune each other's fragments
+            cache_root = os.path.join(BUILD_CACHE_DIR, os.path.basename(output_path))
+            build_cache = BuildCache(cache_root, reuse=not args.full_rebuild)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                write_json(data, f, build_cache, layout)
+            build_cache.save()
+            summary["reused"] = build_cache.reused
+        else:
+            writer = f"dumps_json:{args.json_backend}"
+            start = time.perf_counter()
+            cleaned = clean_nulls(data)
+            _record("clean_nulls", start)
+            write_start = time.perf_counter()
+            encoded = dumps_json(cleaned, layout, args.json_backend)
+            with open(tmp_path, "wb") as f:
+                f.write(encoded)
+    os.replace(tmp_path, output_path)
+    summary["encodeSeconds"] = time.perf_counter() - encode_start
+    summary["size"] = os.path.getsize(output_path)
+    _record(writer, write_start, summary["size"])
+
+    for codec in args.compress:
+        level = args.gzip_level if codec == "gzip" else args.zstd_level
+        path, seconds = compress_file(output_path, codec, level)
+        summary["compressed"].append((f"{codec}-{level}", os.path.getsize(path), seconds))
+        if _stats:
+            _stats.add(f"compress:{codec}", seconds, os.path.getsize(path))
+    return summary
+
+
+def _init_worker(images_by_source: dict, collect_stats: bool):
+    """Give a compile worker the images main already loaded and hashed."""
+    global _stats
+    _images_by_source.update(images_by_source)
+    for ref in images_by_source.values():
+        if ref:
+            _images_by_digest.setdefault(ref.digest, ref)
+    _stats = Stats() if collect_stats else None
+
+
+def _compile_in_worker(plan: dict, output_path: str, args, normalized: dict, variants: dict,
+                       canonical: dict):
+    global _stats
+    if _stats:
+        _stats = Stats()
+    summary = compile_plan(plan, output_path, args, normalized, variants, canonical)
+    return summary, _stats.report() if _stats else None
+
 
-    print(f"\nGenerated: {OUTPUT_PATH}")
-    print(f"  Routines: {len(data['routines'])}")
-    print(f"  Exercises: {total_exercises}")
-    print(f"  Images: {total_images}")
+def print_summary(summary: dict):
+    print(f"\nGenerated: {summary['output']}")
+    print(f"  Routines: {summary['routines']}")
+    print(f"  Exercises: {summary['exercises']}")
+    print(f"  Images: {summary['images']}")
+    print(f"  Distinct images: {summary['distinctImages']}")
+    if summary["reused"] is not None:
+        print(f"  Reused routines: {summary['reused']}/{summary['routines']}")
+    file_size = summary["size"]
     print(f"  File size: {file_size / 1024 / 1024:.1f} MB")
+    if summary["compressed"]:
+        print(f"\n  {'Codec':<10} {'Size':>10} {'Ratio':>7} {'Encode':>10}")
+        print(f"  {'raw':<10} {file_size / 1024:>7.1f} KB {1:>7.2f} "
+              f"{summary['encodeSeconds'] * 1000:>7.1f} ms")
+        for name, size, seconds in summary["compressed"]:
+            print(f"  {name:<10} {size / 1024:>7.1f} KB {file_size / size:>7.2f} "
+                  f"{seconds * 1000:>7.1f} ms")
+
+
+def build_plans(args, plan_paths: list):
+    """Load every plan, prepare their images once and compile them.
+
+    Returns (summaries, sources). Raises OSError or ValueError for a plan
+    that cannot be read, and FileNotFoundError naming every missing local
+    image.
+    """
+    plans = [load_plan(path) for path in plan_paths]
+    outputs = [
+        args.output or plan_output_path(path, plan, args.format, args.out_dir)
+        for path, plan in zip(plan_paths, plans)
+    ]
+    if len(set(map(os.path.abspath, outputs))) < len(outputs):
+        raise ValueError("several plans would write the same output file")
+    os.makedirs(args.out_dir or ".", exist_ok=True)
+
+    # Images shared by several plans are fetched, hashed and normalized once, here
+    sources = list(dict.fromkeys(source for plan in plans for source in plan_sources(plan)))
+    ingest_local_images(sources, workers=args.workers)
+    start = time.perf_counter()
+    prefetch_images(sources, workers=args.workers, per_host=args.per_host,
+                    revalidate=args.revalidate, budget=args.fetch_budget)
+    _record("prefetch", start)
+    refs = {}
+    for source in sources:
+        ref = load_image(source)
+        if ref:
+            refs.setdefault(ref.digest, ref)
+    image_cache().save()
+
+    canonical = None
+    if args.similar or args.collapse_similar:
+        canonical = find_similar(refs, sources, args.similar_distance, report=args.similar)
+        if args.collapse_similar:
+            refs = {digest: ref for digest, ref in refs.items() if digest not in canonical}
+        else:
+            canonical = None
+
+    normalized = variants = None
+    sizes = ([args.max_size] if args.normalize else []) + list(args.variant.values())
+    if sizes:
+        start = time.perf_counter()
+        by_size = normalize_images(refs, sizes, fmt=args.image_format, quality=args.quality)
+        _record("normalize", start)
+        if args.normalize:
+            normalized = by_size[args.max_size]
+        # Variants are made from the originals but looked up by the embedded image
+        embedded = {digest: (normalized[digest] if normalized else ref).digest
+                    for digest, ref in refs.items()}
+        variants = {
+            name: {embedded[digest]: ref for digest, ref in by_size[size].items()}
+            for name, size in args.variant.items()
+        }
+
+    jobs = min(args.jobs or 1, len(plans))
+    if jobs > 1:
+        print(f"Compiling {len(plans)} plans with {jobs} worker(s)...")
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker,
+            initargs=(_images_by_source, _stats is not None),
+        ) as pool:
+            futures = [
+                pool.submit(_compile_in_worker, plan, output, args, normalized, variants,
+                            canonical)
+                for plan, output in zip(plans, outputs)
+            ]
+            summaries = []
+            for future in futures:
+                summary, report = future.result()
+                summaries.append(summary)
+                if _stats:
+                    _stats.merge(report)
+    else:
+        print(f"Building {len(plans)} plan(s)..." if len(plans) > 1
+              else "Building postural plan routines...")
+        summaries = [compile_plan(plan, output, args, normalized, variants, canonical)
+                     for plan, output in zip(plans, outputs)]
+    return summaries, sources
+
+
+def forget_images(paths):
+    """Drop loaded ImageRefs read from any of paths, and failed loads, so they load again."""
+    paths = set(paths)
+    for source, ref in list(_images_by_source.items()):
+        if ref is None or ref.path in paths:
+            del _images_by_source[source]
+    for digest, ref in list(_images_by_digest.items()):
+        if ref.path in paths:
+            del _images_by_digest[digest]
+
+
+def _snapshot(files: list, directories: list) -> dict:
+    """(mtime, size) of every file in files and directly inside directories."""
+    state = {}
+    for path in files:
+        try:
+            st = os.stat(path)
+            state[path] = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            pass
+    for directory in directories:
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_file():
+                    st = entry.stat()
+                    state[entry.path] = (st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                pass
+    return state
+
+
+def watch(args, plan_paths: list, interval: float = 0.2):
+    """Rebuild whenever a plan, a LOCAL_IMG_DIR file or the image cache index changes.
+
+    Files are polled, and a burst of changes is built once after the
+    sources have been quiet for args.debounce seconds. Only changed images
+    are hashed again, and the build cache re-serializes only the routines
+    whose fields or images changed; outputs are replaced atomically.
+    """
+    global _image_cache
+    index_path = os.path.join(CACHE_DIR, "index.json")
+    files, directories = [*plan_paths, index_path], [LOCAL_IMG_DIR]
+    state = _snapshot(files, directories)
+    print(f"\nWatching {len(plan_paths)} plan(s), {LOCAL_IMG_DIR} and {CACHE_DIR} "
+          f"(Ctrl-C to stop)...")
+    try:
+        while True:
+            time.sleep(interval)
+            current = _snapshot(files, directories)
+            if current == state:
+                continue
+            while True:
+                time.sleep(args.debounce)
+                latest = _snapshot(files, directories)
+                if latest == current:
+                    break
+                current = latest
+
+            changed = {path for path in state.keys() | current.keys()
+                       if state.get(path) != current.get(path)}
+            stale = {path for path in changed if os.path.dirname(path) == LOCAL_IMG_DIR}
+            if index_path in changed:
+                # Another run updated the cache; reload and forget URLs it re-stored
+                old = image_cache().entries
+                _image_cache = None
+                new = image_cache().entries
+                stale.update(image_cache().object_path(old[url]["hash"])
+                             for url in old if old[url] != new.get(url))
+            forget_images(stale)
+
+            start = time.perf_counter()
+            try:
+                summaries, _ = build_plans(args, plan_paths)
+            except (OSError, ValueError) as e:
+                print(f"ERROR: {e}")
+            else:
+                for summary in summaries:
+                    reused = ("" if summary["reused"] is None else
+                              f", {summary['reused']}/{summary['routines']} routines reused")
+                    print(f"Rebuilt {summary['output']} in "
+                          f"{(time.perf_counter() - start) * 1000:.0f} ms{reused}")
+            # Our own writes (cache index, outputs) are not changes to react to
+            state = _snapshot(files, directories)
+    except KeyboardInterrupt:
+        print()
+
+
+def main(argv=None):
+    global _stats
+    args = parse_args(argv)
+    if args.stats or args.stats_json:
+        _stats = Stats()
+
+    _retry_policy.timeout = args.timeout
+    _retry_policy.retries = args.retries
+
+    plan_paths = args.plan or [DEFAULT_PLAN]
+    if args.output and len(plan_paths) > 1:
+        sys.exit("ERROR: --output needs a single --plan; use --out-dir for several")
+
+    codecs = []
+    for codec in dict.fromkeys(args.compress):
+        if codec == "zstd" and importlib.util.find_spec("zstandard") is None:
+            print("WARNING: zstandard is not installed; skipping zstd output")
+            continue
+        codecs.append(codec)
+    args.compress = codecs
+    try:
+        args.json_backend = json_backend(args.json_backend)
+    except ValueError as e:
+        sys.exit(f"ERROR: {e}")
+
+    cache = image_cache()
+    if args.check_cache:
+        problems = cache.check()
+        for url, problem in problems:
+            print(f"  WARNING: Dropping cached {url[:80]}: {problem}")
+        print(f"Checked {len(cache.entries) + len(problems)} cached image(s), "
+              f"{len(problems)} bad")
+
+    try:
+        summaries, sources = build_plans(args, plan_paths)
+    except (OSError, ValueError) as e:
+        sys.exit(f"ERROR: {e}")
+
+    if args.prune_cache:
+        cache.prune(sources)
+    removed, freed = cache.gc(args.cache_max_mb * 1024 * 1024 if args.cache_max_mb else None)
+    cache.save()
+
+    for summary in summaries:
+        print_summary(summary)
+    if removed:
+        print(f"\nCache: removed {removed} file(s), freed {freed / 1024:.1f} KB")
+
+    if _stats:
+        if args.stats:
+            _stats.print_table()
+        if args.stats_json:
+            with open(args.stats_json, "w") as f:
+                json.dump(_stats.report(), f, indent=2)
+                f.write("\n")
+
+    if args.watch:
+        watch(args, plan_paths)
 
 
 if __name__ == "__main__":
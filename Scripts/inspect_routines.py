@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Validate and summarize a routines JSON export in constant memory.
+
+Usage:
+    python3 Scripts/inspect_routines.py routines.json [--exercises] [--json]
+
+The file (optionally gzip-compressed) is parsed incrementally: image
+strings are measured and checked as they stream past and are never held in
+memory, so multi-hundred-MB exports cost a few buffers at most.
+
+Validation mirrors RoutineFileService.validate(_:) and the required fields
+of RoutineDTO/ExerciseDTO. Exits with status 1 if any check fails.
+"""
+
+import argparse
+import gzip
+import json
+import re
+import sys
+import unicodedata
+
+_NON_WS = re.compile(r"[^ \t\n\r]")
+_STRING_SPECIAL = re.compile(r'["\\]')
+_B64_INVALID = re.compile(r"[^A-Za-z0-9+/=]")
+_NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+ROUTINE_FIELDS = {"name": str, "isDefault": bool, "intervalMinutes": int, "isActive": bool,
+                  "exercises": list}
+EXERCISE_FIELDS = {"name": str, "durationSeconds": int, "description": str, "iconName": str,
+                   "sortOrder": int, "sets": int, "restSeconds": int, "restAfterSeconds": int}
+
+
+class ParseError(ValueError):
+    pass
+
+
+class JSONStream:
+    """A pull parser over a text stream that reads it in fixed-size chunks."""
+
+    def __init__(self, f, chunk_size: int = 1 << 16):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.offset = 0
+
+    def _fill(self) -> bool:
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.offset += self.pos
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _ensure(self, n: int) -> bool:
+        while len(self.buf) - self.pos < n:
+            if not self._fill():
+                return False
+        return True
+
+    def error(self, message: str):
+        raise ParseError(f"{message} at character {self.offset + self.pos}")
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ("" at end of input)."""
+        while True:
+            m = _NON_WS.search(self.buf, self.pos)
+            if m:
+                self.pos = m.start()
+                return self.buf[self.pos]
+            self.pos = len(self.buf)
+            if not self._fill():
+                return ""
+
+    def expect(self, ch: str):
+        if self.peek() != ch:
+            self.error(f"Expected {ch!r}")
+        self.pos += 1
+
+    def iter_object(self):
+        """Yield each key of an object; the caller must consume its value."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                self.error("Expected object key")
+            key = self.read_string()
+            self.expect(":")
+            yield key
+            after = self.peek()
+            self.pos += 1
+            if after == "}":
+                return
+            if after != ",":
+                self.error("Expected ',' or '}'")
+
+    def iter_array(self):
+        """Yield once per array element; the caller must consume it."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            after = self.peek()
+            self.pos += 1
+            if after == "]":
+                return
+            if after != ",":
+                self.error("Expected ',' or ']'")
+
+    def scan_string(self, on_segment):
+        """Stream a string's unescaped contents to on_segment piece by piece."""
+        self.expect('"')
+        while True:
+            m = _STRING_SPECIAL.search(self.buf, self.pos)
+            if not m:
+                on_segment(self.buf[self.pos:])
+                self.pos = len(self.buf)
+                if not self._fill():
+                    self.error("Unterminated string")
+                continue
+            if m.start() > self.pos:
+                on_segment(self.buf[self.pos:m.start()])
+            self.pos = m.end()
+            if m.group() == '"':
+                return
+            if not self._ensure(1):
+                self.error("Unterminated escape")
+            esc = self.buf[self.pos]
+            if esc == "u":
+                if not self._ensure(5):
+                    self.error("Unterminated escape")
+                on_segment(chr(int(self.buf[self.pos + 1:self.pos + 5], 16)))
+                self.pos += 5
+            elif esc in _ESCAPES:
+                on_segment(_ESCAPES[esc])
+                self.pos += 1
+            else:
+                self.error(f"Invalid escape \\{esc}")
+
+    def read_string(self) -> str:
+        parts = []
+        self.scan_string(parts.append)
+        text = "".join(parts)
+        # Combine UTF-16 surrogate pairs produced by \\u escapes
+        return text.encode("utf-16", "surrogatepass").decode("utf-16")
+
+    def read_value(self):
+        """Read a scalar, or a small container, as a Python value."""
+        ch = self.peek()
+        if ch == '"':
+            return self.read_string()
+        if ch == "{":
+            result = {}
+            for key in self.iter_object():
+                result[key] = self.read_value()
+            return result
+        if ch == "[":
+            result = []
+            for _ in self.iter_array():
+                result.append(self.read_value())
+            return result
+        for literal, value in (("true", True), ("false", False), ("null", None)):
+            if ch == literal[0]:
+                self._ensure(len(literal))
+                if self.buf.startswith(literal, self.pos):
+                    self.pos += len(literal)
+                    return value
+                self.error("Invalid literal")
+        while True:
+            m = _NUMBER.match(self.buf, self.pos)
+            if m and m.end() == len(self.buf) and self._fill():
+                continue
+            break
+        if not m:
+            self.error("Unexpected character" if ch else "Unexpected end of input")
+        self.pos = m.end()
+        text = m.group()
+        return float(text) if any(c in text for c in ".eE") else int(text)
+
+    def read_scalar(self):
+        """Read a scalar; containers are skipped and read as None."""
+        if self.peek() in ("{", "["):
+            self.skip_value()
+            return None
+        return self.read_value()
+
+    def skip_value(self):
+        """Consume any value, streaming past strings without keeping them."""
+        ch = self.peek()
+        if ch == '"':
+            self.scan_string(lambda segment: None)
+        elif ch == "{":
+            for _ in self.iter_object():
+                self.skip_value()
+        elif ch == "[":
+            for _ in self.iter_array():
+                self.skip_value()
+        else:
+            self.read_value()
+
+
+class _ImageMeter:
+    """Measures one Base64 image string as it streams past."""
+
+    def __init__(self):
+        self.chars = 0
+        self.tail = ""
+        self.valid = True
+
+    def __call__(self, segment: str):
+        self.chars += len(segment)
+        self.tail = (self.tail + segment[-2:])[-2:]
+        if self.valid and _B64_INVALID.search(segment):
+            self.valid = False
+
+    def result(self) -> dict:
+        if self.chars % 4:
+            return {"bytes": 0, "valid": False}
+        return {"bytes": self.chars // 4 * 3 - self.tail.count("="), "valid": self.valid}
+
+
+def _is_blank(name: str) -> bool:
+    """True if name is empty after trimming Foundation's .whitespaces set."""
+    return all(c == "\t" or unicodedata.category(c) == "Zs" for c in name)
+
+
+def _is_type(value, kind) -> bool:
+    if kind is int:
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, kind)
+
+
+def _scan_exercise(js: JSONStream) -> dict:
+    fields, images = {}, []
+    for key in js.iter_object():
+        if key == "images" and js.peek() == "[":
+            fields["images"] = []
+            for _ in js.iter_array():
+                if js.peek() == '"':
+                    meter = _ImageMeter()
+                    js.scan_string(meter)
+                    images.append(meter.result())
+                else:
+                    images.append({"bytes": 0, "valid": False})
+                    js.skip_value()
+        else:
+            fields[key] = js.read_scalar()
+    fields["_images"] = images
+    return fields
+
+
+def _scan_routine(js: JSONStream) -> dict:
+    fields, exercises = {}, []
+    for key in js.iter_object():
+        if key == "exercises" and js.peek() == "[":
+            fields["exercises"] = []
+            for _ in js.iter_array():
+                if js.peek() == "{":
+                    exercises.append(_scan_exercise(js))
+                else:
+                    exercises.append(None)
+                    js.skip_value()
+        else:
+            fields[key] = js.read_scalar()
+    fields["_exercises"] = exercises
+    return fields
+
+
+def effective_duration(ex: dict) -> int:
+    """Seconds one set lasts, as Exercise.effectiveDurationSeconds computes it."""
+    reps = ex.get("reps") or 0
+    if reps > 0:
+        return reps * (ex.get("secondsPerRep") or 5)
+    return ex.get("durationSeconds") or 0
+
+
+def _check_fields(fields: dict, schema: dict, what: str, errors: list):
+    for name, kind in schema.items():
+        if name not in fields or fields[name] is None:
+            errors.append(f"{what} is missing required field \"{name}\".")
+        elif not _is_type(fields[name], kind):
+            errors.append(f"{what} has a non-{kind.__name__} \"{name}\".")
+
+
+def inspect(f) -> dict:
+    """Scan a RoutineFile JSON stream and return its statistics and errors."""
+    js = JSONStream(f)
+    errors, routines = [], []
+    seen_routines = False
+    for key in js.iter_object():
+        if key == "routines" and js.peek() == "[":
+            seen_routines = True
+            for _ in js.iter_array():
+                if js.peek() == "{":
+                    routines.append(_scan_routine(js))
+                else:
+                    errors.append(f"Routine {len(routines) + 1} is not an object.")
+                    routines.append(None)
+                    js.skip_value()
+        else:
+            js.skip_value()
+    if js.peek():
+        js.error("Trailing data")
+    if not seen_routines:
+        errors.append("File is missing required field \"routines\".")
+
+    report = []
+    if seen_routines and not routines:
+        errors.append("File contains no routines.")
+    for i, routine in enumerate(routines):
+        if routine is None:
+            continue
+        name = routine.get("name") if isinstance(routine.get("name"), str) else ""
+        _check_fields(routine, ROUTINE_FIELDS, f"Routine {i + 1}", errors)
+        if _is_blank(name):
+            errors.append(f"Routine {i + 1} has an empty name.")
+
+        exercises = []
+        for j, ex in enumerate(routine["_exercises"]):
+            if ex is None:
+                errors.append(f"Exercise {j + 1} in \"{name}\" is not an object.")
+                continue
+            ex_name = ex.get("name") if isinstance(ex.get("name"), str) else ""
+            _check_fields(ex, EXERCISE_FIELDS, f"Exercise {j + 1} in \"{name}\"", errors)
+            if _is_blank(ex_name):
+                errors.append(f"Exercise {j + 1} in \"{name}\" has an empty name.")
+            reps = ex.get("reps") if _is_type(ex.get("reps"), int) else 0
+            duration = ex.get("durationSeconds")
+            if reps <= 0 and _is_type(duration, int) and duration < 1:
+                errors.append(f"\"{ex_name}\" in \"{name}\" must have duration >= 1 second.")
+            sets = ex.get("sets")
+            if _is_type(sets, int) and sets < 1:
+                errors.append(f"\"{ex_name}\" in \"{name}\" must have sets >= 1.")
+            for k, image in enumerate(ex["_images"]):
+                if not image["valid"]:
+                    errors.append(f"Image {k + 1} of \"{ex_name}\" in \"{name}\" is not valid "
+                                  "Base64 and would be skipped on import.")
+
+            exercises.append({
+                "name": ex_name,
+                "effectiveDurationSeconds": effective_duration(ex),
+                "sets": sets if _is_type(sets, int) else None,
+                "images": len(ex["_images"]),
+                "imageBytes": [image["bytes"] for image in ex["_images"]],
+            })
+
+        report.append({
+            "name": name,
+            "exercises": exercises,
+            "exerciseCount": len(exercises),
+            "imageCount": sum(e["images"] for e in exercises),
+            "imageBytes": sum(sum(e["imageBytes"]) for e in exercises),
+            "activeSeconds": sum(e["effectiveDurationSeconds"] * (e["sets"] or 0)
+                                 for e in exercises),
+        })
+
+    return {"routines": report, "errors": errors}
+
+
+def _open(path: str):
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate and summarize a routines JSON export")
+    parser.add_argument("path", help="routines JSON file (.gz accepted, - for stdin)")
+    parser.add_argument("--exercises", action="store_true", help="list every exercise")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        with _open(args.path) as f:
+            result = inspect(f)
+    except ParseError as e:
+        print(f"{args.path}: invalid JSON: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.json:
+        json.dump(result, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    else:
+        routines = result["routines"]
+        print(f"{args.path}: {len(routines)} routine(s), "
+              f"{sum(r['exerciseCount'] for r in routines)} exercise(s), "
+              f"{sum(r['imageCount'] for r in routines)} image(s), "
+              f"{sum(r['imageBytes'] for r in routines) / 1024 / 1024:.1f} MB of image data")
+        for r in routines:
+            print(f"  {r['name'][:40]:<40} {r['exerciseCount']:>3} ex {r['imageCount']:>3} img "
+                  f"{r['imageBytes'] / 1024:>8.1f} KB {r['activeSeconds'] / 60:>6.1f} min active")
+            if args.exercises:
+                for e in r["exercises"]:
+                    print(f"      {e['name'][:36]:<36} {e['effectiveDurationSeconds']:>4} s "
+                          f"x{e['sets'] or 0:<2} {e['images']:>2} img "
+                          f"{sum(e['imageBytes']) / 1024:>8.1f} KB")
+        for error in result["errors"]:
+            print(f"ERROR: {error}")
+
+    if result["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Serve cached images over local HTTP with simulated network conditions.
+
+Usage:
+    python3 Scripts/netsim_server.py [options]   (see --help)
+
+A stand-in for the image hosts the plans download from, so the fetch
+layer can be exercised without the internet. Every URL in the image cache
+index, http(s)://host/path, is served at http://127.0.0.1:PORT/host/path
+(see local_url). Responses carry an ETag and honour If-None-Match.
+
+Conditions, all optional:
+    latency     delay before each response, plus up to jitter more
+    bandwidth   throughput of each connection, in KB/s
+    error rate  fraction of requests that fail: a 503, a dropped
+                connection, or a body cut short
+    rate limit  requests per second per original host; the excess gets
+                429 with Retry-After
+"""
+
+import argparse
+import http.server
+import json
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+import urllib.parse
+
+import generate_postural_plan as gen
+
+# Named conditions for the benchmark; every key is optional (see SimServer)
+PROFILES = {
+    "lan": {},
+    "broadband": {"latency_ms": 40, "jitter_ms": 20, "bandwidth_kbps": 4096},
+    "mobile": {"latency_ms": 150, "jitter_ms": 100, "bandwidth_kbps": 400},
+    "flaky": {"latency_ms": 60, "jitter_ms": 40, "bandwidth_kbps": 2048, "error_rate": 0.2},
+    "throttled": {"latency_ms": 40, "bandwidth_kbps": 2048, "rate_limit": 4},
+}
+
+# What error_rate injects: a 503, a TCP reset instead of a response, or a
+# response cut off halfway through its body
+FAILURES = ("status", "reset", "truncate")
+
+
+def local_url(url: str, base: str) -> str:
+    """The address of url on a SimServer listening at base."""
+    parts = urllib.parse.urlsplit(url)
+    query = "?" + parts.query if parts.query else ""
+    return f"{base}/{parts.netloc}{parts.path}{query}"
+
+
+def routes_from_cache(cache_dir: str = None) -> dict:
+    """Map each cached URL's local path (/host/path) to its object file."""
+    cache = gen.ImageCache(cache_dir or gen.CACHE_DIR)
+    routes = {}
+    for url, entry in cache.entries.items():
+        parts = urllib.parse.urlsplit(url)
+        routes[f"/{parts.netloc}{parts.path}"] = (cache.object_path(entry["hash"]),
+                                                   entry.get("mimeType"), entry["hash"])
+    return routes
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        path = urllib.parse.urlsplit(self.path).path
+        server.count("requests")
+
+        latency = server.latency_ms + server.jitter()
+        if latency:
+            time.sleep(latency / 1000)
+
+        host = path.split("/")[1] if path.count("/") > 1 else ""
+        if not server.take_token(host):
+            server.count("rate_limited")
+            self._empty(429, {"Retry-After": "1"})
+            return
+
+        route = server.routes.get(path)
+        if route is None:
+            self._empty(404)
+            return
+        object_path, mime_type, digest = route
+        etag = f'"{digest}"'
+        if self.headers.get("If-None-Match") == etag:
+            self._empty(304, {"ETag": etag})
+            return
+
+        failure = server.failure()
+        if failure == "status":
+            server.count("errors")
+            self._empty(503)
+            return
+        if failure == "reset":
+            server.count("resets")
+            # Abort with a TCP reset instead of a response
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            self.close_connection = True
+            return
+
+        with open(object_path, "rb") as f:
+            body = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", mime_type or "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        if failure == "truncate":
+            server.count("truncated")
+            body = body[:len(body) // 2]
+            self.close_connection = True
+        server.count("bytes", len(body))
+        server.send_throttled(self.wfile, body)
+
+    def _empty(self, status: int, headers: dict = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class SimServer(http.server.ThreadingHTTPServer):
+    """ThreadingHTTPServer that serves routes under simulated conditions.
+
+    routes maps /host/path to (file, MIME type, digest), as
+    routes_from_cache() returns. Conditions are keyword arguments:
+    latency_ms, jitter_ms, bandwidth_kbps (0 = unlimited), error_rate and
+    rate_limit (requests per second per host, 0 = unlimited). failures
+    limits which FAILURES error_rate injects. seed makes latency jitter and
+    error injection repeatable.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, routes: dict, port: int = 0, latency_ms: float = 0, jitter_ms: float = 0,
+                 bandwidth_kbps: float = 0, error_rate: float = 0, rate_limit: float = 0,
+                 failures: tuple = None, seed: int = None):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.routes = routes
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.bandwidth_kbps = bandwidth_kbps
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.failures = tuple(failures or FAILURES)
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._buckets = {}
+        self._thread = None
+        self.counters = dict.fromkeys(
+            ("requests", "rate_limited", "errors", "resets", "truncated", "bytes"), 0)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def jitter(self) -> float:
+        with self._lock:
+            return self._rng.uniform(0, self.jitter_ms)
+
+    def count(self, counter: str, n: int = 1):
+        with self._lock:
+            self.counters[counter] += n
+
+    def failure(self):
+        """None, or which failure to inject into this response."""
+        with self._lock:
+            if self._rng.random() >= self.error_rate:
+                return None
+            return self._rng.choice(self.failures)
+
+    def take_token(self, host: str) -> bool:
+        """Token bucket per host: rate_limit requests per second, bursts up to rate_limit."""
+        if not self.rate_limit:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(host, (self.rate_limit, now))
+            tokens = min(self.rate_limit, tokens + (now - last) * self.rate_limit)
+            allowed = tokens >= 1
+            self._buckets[host] = (tokens - 1 if allowed else tokens, now)
+            return allowed
+
+    def send_throttled(self, wfile, body: bytes):
+        if not self.bandwidth_kbps:
+            wfile.write(body)
+            return
+        # 20 slices a second keeps the rate smooth without busy-waiting
+        chunk = max(1, int(self.bandwidth_kbps * 1024 / 20))
+        start = time.monotonic()
+        for sent in range(0, len(body), chunk):
+            wfile.write(body[sent:sent + chunk])
+            due = start + (sent + chunk) / (self.bandwidth_kbps * 1024)
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def handle_error(self, request, client_address):
+        # Clients that give up mid-response are part of the simulation
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def start(self):
+        """Serve from a daemon thread; returns self for use as a context manager."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread:
+            self.shutdown()
+        super().__exit__(*exc)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve cached images under simulated conditions")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--profile", choices=sorted(PROFILES),
+                        help="start from a named set of conditions")
+    parser.add_argument("--latency", type=float, help="milliseconds before each response")
+    parser.add_argument("--jitter", type=float, help="up to this many extra milliseconds")
+    parser.add_argument("--bandwidth", type=float, help="KB/s per connection (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, help="fraction of requests that fail")
+    parser.add_argument("--rate-limit", type=float,
+                        help="requests per second per original host (0 = unlimited)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--cache-dir", help=f"image cache to serve (default: {gen.CACHE_DIR})")
+    return parser.parse_args(argv)
+
+
+def profile_from_args(args) -> dict:
+    profile = dict(PROFILES[args.profile]) if args.profile else {}
+    for key, value in (("latency_ms", args.latency), ("jitter_ms", args.jitter),
+                       ("bandwidth_kbps", args.bandwidth), ("error_rate", args.error_rate),
+                       ("rate_limit", args.rate_limit)):
+        if value is not None:
+            profile[key] = value
+    return profile
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    routes = routes_from_cache(args.cache_dir)
+    if not routes:
+        sys.exit("ERROR: the image cache is empty; nothing to serve")
+    profile = profile_from_args(args)
+    server = SimServer(routes, port=args.port, seed=args.seed, **profile)
+    print(f"Serving {len(routes)} image(s) at {server.base_url} with {json.dumps(profile)}")
+    print(f"  e.g. {server.base_url}{next(iter(routes))}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print()
+    finally:
+        print(f"Served: {json.dumps(server.counters)}")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Helpers shared by the generator's tests."""
+
+import contextlib
+import io
+import tempfile
+
+import generate_postural_plan as gen
+from netsim_server import SimServer, routes_from_cache
+
+
+@contextlib.contextmanager
+def fresh_cache():
+    """Point the generator at an empty image cache and reset its per-run state."""
+    saved = gen.CACHE_DIR, gen._image_cache, gen._http_pool, gen._retry_policy
+    with tempfile.TemporaryDirectory() as cache_dir:
+        gen.CACHE_DIR = cache_dir
+        gen._image_cache = None
+        gen._http_pool = gen.HostPool()
+        gen._retry_policy = gen.RetryPolicy(backoff=0.01)
+        gen._failed_downloads.clear()
+        gen._images_by_source.clear()
+        gen._images_by_digest.clear()
+        try:
+            yield cache_dir
+        finally:
+            gen.CACHE_DIR, gen._image_cache, gen._http_pool, gen._retry_policy = saved
+            gen._failed_downloads.clear()
+            gen._images_by_source.clear()
+            gen._images_by_digest.clear()
+
+
+def sim_server(**conditions) -> SimServer:
+    """A started SimServer serving the committed image cache."""
+    return SimServer(routes_from_cache(gen.CACHE_DIR), seed=0, **conditions).start()
+
+
+def cached_urls(count: int = 1) -> list:
+    """The first count URLs in the committed image cache."""
+    return list(gen.ImageCache(gen.CACHE_DIR).entries)[:count]
+
+
+def quietly(fn, *args, **kwargs):
+    """Call fn with its progress output swallowed."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
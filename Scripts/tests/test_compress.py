@@ -0,0 +1,54 @@
+import contextlib
+import gzip
+import io
+import os
+import tempfile
+import unittest
+
+import generate_postural_plan as gen
+
+
+class GzipTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "routines.json")
+        with open(self.path, "wb") as f:
+            f.write(b'{\n  "a": 1\n}')
+
+    def test_header_names_the_uncompressed_file(self):
+        out_path, _ = gen.compress_file(self.path, "gzip", 6)
+        with open(out_path, "rb") as f:
+            header = f.read(64)
+        # FNAME flag set, mtime zeroed, name without the .tmp or .gz suffix
+        self.assertEqual(header[3], gzip.FNAME)
+        self.assertEqual(header[4:8], b"\0\0\0\0")
+        self.assertEqual(header[10:].split(b"\0", 1)[0], b"routines.json")
+        self.assertFalse(os.path.exists(out_path + ".tmp"))
+
+    def test_output_is_reproducible(self):
+        out_path, _ = gen.compress_file(self.path, "gzip", 6)
+        with open(out_path, "rb") as f:
+            first = f.read()
+        gen.compress_file(self.path, "gzip", 6)
+        with open(out_path, "rb") as f:
+            self.assertEqual(f.read(), first)
+        self.assertEqual(gzip.decompress(first), b'{\n  "a": 1\n}')
+
+    def test_failure_leaves_no_temp_file(self):
+        with self.assertRaises(ValueError):
+            gen.compress_file(self.path, "gzip", 12)
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ["routines.json"])
+
+    def test_levels_are_range_checked(self):
+        for flags in (["--gzip-level", "12"], ["--gzip-level", "-1"], ["--zstd-level", "0"],
+                      ["--zstd-level", "23"]):
+            with self.subTest(flags=flags), contextlib.redirect_stderr(io.StringIO()):
+                with self.assertRaises(SystemExit):
+                    gen.parse_args(flags)
+        args = gen.parse_args(["--gzip-level", "9", "--zstd-level", "22"])
+        self.assertEqual((args.gzip_level, args.zstd_level), (9, 22))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import base64
+import json
+import os
+import tempfile
+import unittest
+
+import convert_routines
+import generate_postural_plan as gen
+
+PIXEL = base64.b64encode(b"GIF89a\x01\x00\x01\x00\x00\x00\x00;").decode("ascii")
+
+
+class ConvertTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.dir, name)
+
+    def write_inline(self, name: str, layout: str) -> str:
+        data = {"routines": [{"name": "R/1", "exercises": [{"name": "E", "images": [PIXEL]}]}]}
+        with open(self.path(name), "w", encoding="utf-8") as f:
+            gen.write_json(data, f, layout=gen.JSON_LAYOUTS[layout])
+        return self.path(name)
+
+    def test_round_trip_in_each_layout(self):
+        for layout in gen.JSON_LAYOUTS:
+            with self.subTest(layout=layout):
+                src = self.write_inline(f"{layout}.json", layout)
+                bundle, back = self.path(f"{layout}.zip"), self.path(f"{layout}-back.json")
+                convert_routines.json_to_bundle(src, bundle, layout)
+                convert_routines.bundle_to_json(bundle, back, layout)
+                with open(src, "rb") as a, open(back, "rb") as b:
+                    self.assertEqual(a.read(), b.read())
+
+    def test_image_table_is_rejected(self):
+        with open(self.path("table.json"), "w", encoding="utf-8") as f:
+            json.dump({"routines": [{"name": "R", "exercises": [{"name": "E", "imageRefs": ["d"]}]}],
+                       "imageTable": {"d": PIXEL}}, f)
+        with self.assertRaisesRegex(ValueError, "imageTable"):
+            convert_routines.json_to_bundle(self.path("table.json"), self.path("table.zip"))
+        self.assertFalse(os.path.exists(self.path("table.zip")))
+
+
+if __name__ == "__main__":
+    unittest.main()
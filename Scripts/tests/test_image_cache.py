@@ -0,0 +1,128 @@
+import importlib.util
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import generate_postural_plan as gen
+from netsim_server import local_url
+from tests.support import cached_urls, fresh_cache, quietly, sim_server
+
+
+class MissingObjectTest(unittest.TestCase):
+    def test_deleted_object_is_downloaded_again(self):
+        url = cached_urls()[0]
+        with sim_server() as server, fresh_cache():
+            url = local_url(url, server.base_url)
+            quietly(gen.prefetch_images, [url])
+            path = gen.image_cache().lookup(url)
+            os.remove(path)
+
+            ref = quietly(gen.load_image, url)
+
+            self.assertIsNotNone(ref)
+            self.assertTrue(os.path.isfile(path))
+            self.assertEqual(server.counters["requests"], 2)
+
+    def test_lookup_treats_missing_object_as_miss(self):
+        url = cached_urls()[0]
+        with sim_server() as server, fresh_cache():
+            url = local_url(url, server.base_url)
+            quietly(gen.prefetch_images, [url])
+            os.remove(gen.image_cache().lookup(url))
+
+            self.assertIsNone(gen.image_cache().lookup(url))
+            self.assertNotIn(url, gen.image_cache().entries)
+
+
+@unittest.skipUnless(importlib.util.find_spec("PIL"), "needs Pillow")
+class ImageFormatTest(unittest.TestCase):
+    def setUp(self):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (4, 4), (200, 30, 30)).save(buffer, "BMP")
+        self.bmp = buffer.getvalue()
+
+    def test_formats_without_a_structure_check_are_decoded(self):
+        self.assertIsNone(gen.image_problem(self.bmp))
+        self.assertIsNone(gen.image_problem(self.bmp, "image/bmp"))
+        self.assertIsNotNone(gen.image_problem(self.bmp[:len(self.bmp) // 2]))
+        self.assertIsNotNone(gen.image_problem(b"<html>Not found</html>"))
+
+    def test_bmp_download_keeps_its_content_type(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "pose.bmp")
+            with open(path, "wb") as f:
+                f.write(self.bmp)
+            with sim_server() as server, fresh_cache():
+                server.routes["/example.com/pose.bmp"] = (path, "image/bmp", "0" * 64)
+                url = f"{server.base_url}/example.com/pose.bmp"
+                self.assertIsNotNone(quietly(gen.download_image, url))
+                self.assertEqual(gen.image_cache().entries[url]["mimeType"], "image/bmp")
+
+
+class GarbageCollectionTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache = gen.ImageCache(tmp.name)
+        os.makedirs(self.cache.objects_dir)
+
+    def _object(self, name: str, age: float) -> str:
+        path = self.cache.object_path(name)
+        with open(path, "wb") as f:
+            f.write(b"x" * 10)
+        when = time.time() - age
+        os.utime(path, (when, when))
+        return path
+
+    def test_recent_orphan_is_kept(self):
+        # Another run may have stored it without having saved its index yet
+        path = self._object("a" * 64, age=60)
+        self.assertEqual(self.cache.gc(), (0, 0))
+        self.assertTrue(os.path.exists(path))
+
+    def test_old_orphan_and_temp_file_are_removed(self):
+        orphan = self._object("b" * 64, age=2 * gen.ImageCache.ORPHAN_GRACE_SECONDS)
+        tmp = self._object(".1.2.tmp", age=2 * gen.ImageCache.ORPHAN_GRACE_SECONDS)
+        self.assertEqual(self.cache.gc(), (2, 20))
+        self.assertFalse(os.path.exists(orphan) or os.path.exists(tmp))
+
+    def test_referenced_object_is_kept(self):
+        digest = "c" * 64
+        path = self._object(digest, age=2 * gen.ImageCache.ORPHAN_GRACE_SECONDS)
+        self.cache.entries["https://example.com/c.png"] = {"hash": digest, "size": 10}
+        self.assertEqual(self.cache.gc(), (0, 0))
+        self.assertTrue(os.path.exists(path))
+
+
+class SaveJSONTest(unittest.TestCase):
+    def test_concurrent_saves_do_not_collide(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "sub", "index.json")
+            errors = []
+
+            def save(n):
+                try:
+                    for i in range(50):
+                        gen._save_json_atomic(path, {"writer": n, "i": i})
+                except OSError as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=save, args=(n,)) for n in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(errors, [])
+            self.assertEqual(os.listdir(os.path.dirname(path)), ["index.json"])
+            with open(path) as f:
+                text = f.read()
+            self.assertTrue(text.startswith('{\n  "i": 49,\n') and text.endswith("}\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+
+import generate_postural_plan as gen
+
+
+@unittest.skipUnless(importlib.util.find_spec("PIL"), "needs Pillow")
+class NormalizeImageTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def save(self, name: str, quality: int = 80, **options) -> str:
+        """A small JPEG; at a quality below 80, re-encoding does not shrink it."""
+        from PIL import Image, ImageDraw
+
+        im = Image.new("RGB", (64, 64), (120, 160, 200))
+        ImageDraw.Draw(im).ellipse((8, 8, 56, 56), outline=(20, 20, 20), width=3)
+        path = os.path.join(self.dir, name)
+        im.save(path, "JPEG", quality=quality, optimize=True, **options)
+        return path
+
+    def normalize(self, src: str, fmt: str = "jpeg"):
+        from PIL import Image
+
+        dest = os.path.join(self.dir, f"out-{fmt}")
+        gen.normalize_image(src, dest, 720, fmt, 80)
+        with open(dest, "rb") as f:
+            data = f.read()
+        with open(src, "rb") as f:
+            original = f.read()
+        return Image.open(dest), data == original
+
+    def test_metadata_is_stripped(self):
+        from PIL import Image
+
+        exif = Image.Exif()
+        exif[0x010E] = "ImageDescription"
+        im, kept = self.normalize(self.save("meta.jpg", quality=10, exif=exif,
+                                                 comment=b"note"))
+        self.assertFalse(kept)
+        self.assertFalse(im.getexif())
+        self.assertNotIn("comment", im.info)
+
+    def test_target_format_is_written(self):
+        im, kept = self.normalize(self.save("plain.jpg", quality=10), fmt="webp")
+        self.assertFalse(kept)
+        self.assertEqual(im.format, "WEBP")
+
+    def test_clean_original_in_target_format_is_kept(self):
+        im, kept = self.normalize(self.save("plain.jpg"))
+        self.assertTrue(kept)
+        self.assertEqual(im.format, "JPEG")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import importlib.util
+import json
+import os
+import tempfile
+import unittest
+
+import generate_postural_plan as gen
+
+
+class LoadPlanTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def write(self, name: str, text: str) -> str:
+        path = os.path.join(self.dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def load_exercise(self, **fields):
+        plan = {"routines": [{"name": "R", "exercises": [{"name": "E", **fields}]}]}
+        return gen.load_plan(self.write("plan.json", json.dumps(plan)))
+
+    def assertRejected(self, message: str, **fields):
+        with self.assertRaises(ValueError) as caught:
+            self.load_exercise(**fields)
+        self.assertIn(f"plan.json: routine 1, exercise 1: {message}", str(caught.exception))
+
+    def test_valid_exercise_loads(self):
+        plan = self.load_exercise(sets=3, rest_seconds=10, images=["a.png"], reps=0)
+        self.assertEqual(plan["routines"][0]["exercises"][0]["sets"], 3)
+
+    def test_committed_plan_loads(self):
+        gen.load_plan(gen.DEFAULT_PLAN)
+
+    def test_images_must_be_a_list(self):
+        self.assertRejected("images must be a list", images="7753-m-crop.png")
+
+    def test_images_must_be_strings(self):
+        self.assertRejected("images must be a list of URLs or file names", images=["a.png", 7])
+
+    def test_numbers_must_be_integers(self):
+        self.assertRejected("sets must be an integer, got '3'", sets="3")
+        self.assertRejected("duration_seconds must be an integer", duration_seconds=1.5)
+        self.assertRejected("reps must be an integer, got True", reps=True)
+
+    def test_text_fields_must_be_strings(self):
+        self.assertRejected("icon must be a string", icon=None)
+
+    def test_routine_field_types(self):
+        plan = {"routines": [{"name": "R", "exercises": [], "is_default": "yes"}]}
+        with self.assertRaises(ValueError) as caught:
+            gen.load_plan(self.write("plan.json", json.dumps(plan)))
+        self.assertIn("plan.json: routine 1: is_default must be true or false",
+                      str(caught.exception))
+
+    @unittest.skipUnless(importlib.util.find_spec("yaml"), "needs PyYAML")
+    def test_yaml_scalar_images(self):
+        path = self.write("plan.yaml", "routines:\n  - name: R\n    exercises:\n"
+                                       "      - name: E\n        images: 7753-m-crop.png\n")
+        with self.assertRaises(ValueError) as caught:
+            gen.load_plan(path)
+        self.assertIn("routine 1, exercise 1: images must be a list", str(caught.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
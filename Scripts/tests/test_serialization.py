@@ -0,0 +1,85 @@
+import importlib.util
+import io
+import json
+import unittest
+
+import generate_postural_plan as gen
+
+# Documents whose encoding differs between JSON libraries or is easy to get
+# wrong when relaying out the indented text
+EDGE_CASES = {
+    # One kind per document: a single odd float sends the whole document
+    # to the stdlib encoder
+    "floats": [0.0, -0.0, 1.5, 1e-4, 123456789012345.6, 1e15, 9999999999999998.0],
+    "tiny floats": [1e-5, -1e-7, 5e-324],
+    "huge floats": [1e16, -1e16, 1.5e300],
+    "big ints": [2**63 - 1, 2**64, -(2**70)],
+    "control characters": {"text": "tab\there\nnew line\x00\x1f\x7f "},
+    "slashes": {"a/b": "https://example.com/img/a.png", "end\\": "\\/"},
+    "empty containers": {"list": [], "dict": {}, "nested": [[], {}, [[]]]},
+    "non-ascii": {"Übung": "Schulterblätter zusammenführen", "emoji": "🧘‍♀️", "日本": "ストレッチ"},
+    "tricky keys": {'a": b': '[]', "k\\\\": "{}", "\n[]": "end []"},
+    "scalars": [True, False, 0, -1, "", "\""],
+}
+
+
+def apple_json(obj, depth: int = 0) -> str:
+    """Reference for the "app" layout: how JSONSerialization writes obj."""
+    indent = "  " * depth
+
+    def scalar(value):
+        return json.dumps(value, ensure_ascii=False).replace("/", "\\/")
+
+    if isinstance(obj, dict):
+        if not obj:
+            return "{\n\n" + indent + "}"
+        items = (f"{indent}  {scalar(k)} : {apple_json(obj[k], depth + 1)}" for k in sorted(obj))
+        return "{\n" + ",\n".join(items) + "\n" + indent + "}"
+    if isinstance(obj, list):
+        if not obj:
+            return "[\n\n" + indent + "]"
+        items = (f"{indent}  {apple_json(v, depth + 1)}" for v in obj)
+        return "[\n" + ",\n".join(items) + "\n" + indent + "]"
+    return scalar(obj)
+
+
+EXPECTED = {
+    "python": lambda obj: json.dumps(obj, indent=2, ensure_ascii=False),
+    "app": apple_json,
+}
+
+
+def available_backends() -> list:
+    return [name for name in gen.JSON_BACKENDS
+            if name != "orjson" or importlib.util.find_spec("orjson")]
+
+
+class SerializationTest(unittest.TestCase):
+    def test_backends_match_reference(self):
+        for backend in available_backends():
+            for layout_name, expected in EXPECTED.items():
+                layout = gen.JSON_LAYOUTS[layout_name]
+                for case, doc in EDGE_CASES.items():
+                    with self.subTest(backend=backend, layout=layout_name, case=case):
+                        got = gen.dumps_json(doc, layout, backend).decode("utf-8")
+                        self.assertEqual(got, expected(doc))
+
+    def test_streaming_writer_matches_reference(self):
+        for layout_name, expected in EXPECTED.items():
+            layout = gen.JSON_LAYOUTS[layout_name]
+            for case, doc in EDGE_CASES.items():
+                with self.subTest(layout=layout_name, case=case):
+                    f = io.StringIO()
+                    gen.write_json(doc, f, layout=layout)
+                    self.assertEqual(f.getvalue(), expected(doc))
+
+    def test_output_round_trips(self):
+        for backend in available_backends():
+            for layout in gen.JSON_LAYOUTS.values():
+                for case, doc in EDGE_CASES.items():
+                    with self.subTest(backend=backend, layout=layout.name, case=case):
+                        self.assertEqual(json.loads(gen.dumps_json(doc, layout, backend)), doc)
+
+
+if __name__ == "__main__":
+    unittest.main()
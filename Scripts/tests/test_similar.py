@@ -0,0 +1,29 @@
+import unittest
+
+import generate_postural_plan as gen
+
+
+def index_of(hashes: dict) -> gen.PerceptualIndex:
+    index = gen.PerceptualIndex("/nonexistent/phash.json")
+    index.hashes = {d: {"dhash": f"{value:016x}", "pixels": 1} for d, value in hashes.items()}
+    return index
+
+
+class ClustersTest(unittest.TestCase):
+    def test_default_keeps_distinct_drawings_apart(self):
+        # Distinct drawings can differ in as few as 4 bits
+        index = index_of({"a": 0, "b": 0b1111})
+        self.assertEqual(index.clusters(["a", "b"]), [])
+
+    def test_default_groups_reencoded_copies(self):
+        index = index_of({"a": 0, "b": 1 << 63 | 1})
+        self.assertEqual(index.clusters(["a", "b"]), [["a", "b"]])
+
+    def test_threshold_is_inclusive(self):
+        index = index_of({"a": 0, "b": 0b111})
+        self.assertEqual(index.clusters(["a", "b"], max_distance=2), [])
+        self.assertEqual(index.clusters(["a", "b"], max_distance=3), [["a", "b"]])
+
+
+if __name__ == "__main__":
+    unittest.main()